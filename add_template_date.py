@@ -7,6 +7,8 @@ from pywikibot import pagegenerators
 import mwparserfromhell
 
 from constants import MONTHS_GENITIVE, MONTHS
+import templateindex
+import templatenames
 
 PROBLEM_TEMPLATES = {
     'проблеми',
@@ -328,11 +330,7 @@ SCOPE = {
     # ),
 }
 
-TEMPLATES_2_PROBLEMS = {
-    template: problem
-    for problem, work in SCOPE.items()
-    for template in work['template_names']
-}
+TEMPLATE_NAMES = templatenames.TemplateNames(filename=templatenames.CACHE_FILE)
 PARAMS_2_PROBLEMS = {
     param: problem
     for problem, work in SCOPE.items()
@@ -341,16 +339,42 @@ PARAMS_2_PROBLEMS = {
 
 def main():
     site = pywikibot.Site()
+    TEMPLATE_NAMES.site = site  # to follow redirects between templates
+    index = None
+    if '--index' in sys.argv:  # find pages with templates in local index, not in categories
+        index = templateindex.TemplateIndex()
+        templateindex.update(index, site)
     for category_name, work in SCOPE.items():
-        add_dates(site, category_name, work['template_names'])
+        add_dates(site, category_name, work['template_names'], index)
 
-def add_dates(site, category_name, template_names):
+def add_dates(site, category_name, template_names, index=None):
     print('Розчищаємо', category_name)
-    cat = pywikibot.Category(site, 'Категорія:' + category_name)
+    if index is None:
+        cat = pywikibot.Category(site, 'Категорія:' + category_name)
+        pages = cat.articles()
+    else:
+        names = TEMPLATE_NAMES.spellings(template_names) | TEMPLATE_NAMES.spellings(PROBLEM_TEMPLATES)
+        pages = (pywikibot.Page(site, title) for title in index.pages_with(names, namespaces=[0]))
 
-    for page in pagegenerators.PreloadingGenerator(cat.articles(), 10):
+    problems_parameters = SCOPE[category_name].get('problems_parameters', {})
+    for page in pagegenerators.PreloadingGenerator(pages, 10):
+        if index is not None and not has_undated_template(page.text, category_name, problems_parameters):
+            continue  # templates with dates are not in the category
         fix_page(site, page)
 
+def has_undated_template(text, category_name, problems_parameters):
+    """Whether text has template of category_name without date, or such parameter of {{Проблеми}}"""
+    keys, problem_keys = template_keys(category_name), template_keys()
+    for template in mwparserfromhell.parse(text).filter_templates():
+        if match_template(template, keys):
+            if not (template.has('дата') and template.get('дата').value.strip()):
+                return True
+        if match_template(template, problem_keys):
+            for param in template.params:
+                if not param.showkey and any(weak_equal(param.value, p) for p in problems_parameters):
+                    return True
+    return False
+
 def fix_page(site, page):
     print()
     print(page.title())
@@ -369,13 +393,13 @@ def fix_page(site, page):
             ensure_category_existence(site, problem, date)
             formatted_date = get_template_date_for(date)
             for template in code.filter_templates():
-                if match_template(template, SCOPE[problem]['template_names']):
+                if match_template(template, template_keys(problem)):
                     if not template.has("дата"):
                         template.add("дата", formatted_date)
                     else: # template has дата
                         if not template.get('дата').value.strip():
                             template.add("дата", formatted_date)
-                if match_template(template, PROBLEM_TEMPLATES):
+                if match_template(template, template_keys()):
                     params_to_update = {}
                     for param in template.params[:]:
                         param_name = str(param)
@@ -412,9 +436,9 @@ def find_problems(code):
         return problems
     for tmpl in code.filter_templates():
         tmpl_name = normalized_template_name(tmpl)
-        if tmpl_name in TEMPLATES_2_PROBLEMS:
-            problems.add(TEMPLATES_2_PROBLEMS[tmpl_name])
-        if tmpl_name in PROBLEM_TEMPLATES:
+        if tmpl_name in templates_2_problems():
+            problems.add(templates_2_problems()[tmpl_name])
+        if match_template(tmpl, template_keys()):
             for param in tmpl.params:
                 if not str(param).strip():
                     continue
@@ -470,15 +494,35 @@ def ensure_category_existence(site, category_name, added):
     cat.save('Створення категорії впорядкування')
     EXISTING_CATEGORIES.add(name)
 
+def template_key(name):
+    """Lowercase canonical name of template, with redirects followed, as in SCOPE"""
+    return (TEMPLATE_NAMES.resolve(name) or '').lower()
+
 def normalized_template_name(template):
-    tmpl_name = template.name.lower().strip()
-    tmpl_name = tmpl_name.replace('_', ' ')
-    if tmpl_name.startswith('шаблон:'):
-        tmpl_name = tmpl_name[len('шаблон:'):]
-    return tmpl_name.strip()
+    return template_key(str(template.name))
+
+TEMPLATE_KEYS = {}  # category name, or None for PROBLEM_TEMPLATES: keys of its templates, filled on first use
+def template_keys(category_name=None):
+    """Frozenset of template keys of SCOPE entry, or of PROBLEM_TEMPLATES"""
+    keys = TEMPLATE_KEYS.get(category_name)
+    if keys is None:
+        names = PROBLEM_TEMPLATES if category_name is None else SCOPE[category_name]['template_names']
+        keys = TEMPLATE_KEYS[category_name] = frozenset(name.lower() for name in TEMPLATE_NAMES.group(names))
+    return keys
+
+TEMPLATES_2_PROBLEMS = {}  # template key: problem, filled on first use
+def templates_2_problems():
+    if not TEMPLATES_2_PROBLEMS:
+        TEMPLATES_2_PROBLEMS.update(
+            (key, problem)
+            for problem in SCOPE
+            for key in template_keys(problem)
+        )
+    return TEMPLATES_2_PROBLEMS
 
-def match_template(template, template_names):
-    return normalized_template_name(template) in template_names
+def match_template(template, keys):
+    """Whether template is one of template_keys()"""
+    return normalized_template_name(template) in keys
 
 def get_category_name_for_date(category_name, timestamp):
     return 'Категорія:' + category_name + ' з ' + MONTHS_GENITIVE[timestamp.month - 1] + ' ' + str(timestamp.year)
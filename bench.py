@@ -0,0 +1,272 @@
+"""
+Throughput benchmark of dump consumers.
+
+Builds synthetic, but ukwiki-like dump (articles with templates, links,
+comments, headings, tables, talk and user pages, redirects), and times
+separately decompression, XML parsing, wikitext parsing and report logic
+of every consumer. Results are appended to bench_results.jsonl and compared
+with the previous run on the same fixture.
+
+    python3 bench.py --pages 20000
+"""
+
+import io
+import os
+import bz2
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+import dumpscan
+import wikitext
+import dumpquery
+import links
+
+RESULTS_FILE = 'bench_results.jsonl'
+
+WORDS = '''
+у на з до та що як за від по для не був була було року році місто село район області
+український українська історія війна культура мова народ держава церква школа університет
+розташований заснований відомий перший головний великий новий старий річка гора озеро
+населення площа територія центр поет письменник художник композитор вчений політик
+'''.split()
+NAMES = '''
+Київ Львів Харків Одеса Дніпро Чернігів Полтава Житомир Вінниця Тернопіль Україна Польща
+Тарас_Шевченко Іван_Франко Леся_Українка Богдан_Хмельницький Дніпро_(річка) Карпати
+Київська_Русь Гетьманщина Друга_світова_війна Європа Чорне_море Крим Волинь Поділля
+'''.split()
+MIXED = ['Kиїв', 'сеlо', 'Xарків', 'мiсто', 'pоку']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=5000, help='pages in the fixture')
+    parser.add_argument('--seed', type=int, default=1814)
+    parser.add_argument('--fixture', help='fixture file (default: bench-<pages>.xml.bz2)')
+    parser.add_argument('--results', default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    fixture = args.fixture or f'bench-{args.pages}.xml.bz2'
+    if not os.path.exists(fixture):
+        print('Building', fixture)
+        write_fixture(fixture, args.pages, args.seed)
+
+    results = run(fixture)
+    record = dict(
+        date=datetime.now().isoformat(timespec='seconds'),
+        commit=git_commit(),
+        fixture=dict(pages=args.pages, seed=args.seed, size=os.path.getsize(fixture)),
+        results=results,
+    )
+    previous = load_previous(args.results, record['fixture'])
+    print_results(results, previous)
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def sentence(rnd):
+    words = []
+    for _ in range(rnd.randint(6, 20)):
+        r = rnd.random()
+        if r < 0.12:
+            name = rnd.choice(NAMES)
+            if rnd.random() < 0.3:
+                words.append(f'[[{name.replace("_", " ")}|{rnd.choice(WORDS)}]]')
+            else:
+                words.append(f'[[{name.replace("_", " ")}]]')
+        elif r < 0.14:
+            words.append(rnd.choice(MIXED))
+        elif r < 0.16:
+            words.append(f"''{rnd.choice(WORDS)}''")
+        else:
+            words.append(rnd.choice(WORDS))
+    text = ' '.join(words).capitalize() + '.'
+    if rnd.random() < 0.2:
+        url = f'https://example.com/{rnd.randint(1, 10**6)}'
+        text += f'<ref>{{{{cite web|url={url}|title={rnd.choice(WORDS)}|publisher=[[{rnd.choice(NAMES)}]]}}}}</ref>'
+    if rnd.random() < 0.05:
+        text += f'<!-- {" ".join(rnd.choices(WORDS, k=rnd.randint(5, 300)))} -->'
+    return text
+
+
+def article(rnd):
+    parts = [
+        '{{Картка:Населений пункт\n'
+        f'| назва = {rnd.choice(NAMES)}\n'
+        f'| населення = {rnd.randint(100, 10**6)}\n'
+        f'| країна = [[{rnd.choice(NAMES)}]]\n'
+        '}}\n'
+    ]
+    for _ in range(rnd.randint(1, 8)):
+        parts.append(f'\n== {rnd.choice(WORDS).capitalize()} {rnd.choice(WORDS)} ==\n')
+        for _ in range(rnd.randint(1, 6)):
+            parts.append(' '.join(sentence(rnd) for _ in range(rnd.randint(1, 6))) + '\n\n')
+        if rnd.random() < 0.1:
+            parts.append('{| class="wikitable"\n|-\n! Рік !! Населення\n')
+            for year in range(1900, 2000, 25):
+                parts.append(f'|-\n| {year} || {rnd.randint(100, 10**5)}\n')
+            parts.append('|}\n')
+        if rnd.random() < 0.1:
+            parts.append(f'[[Файл:{rnd.choice(WORDS)}.jpg|thumb|{sentence(rnd)}]]\n')
+    parts.append('\n== Примітки ==\n{{reflist}}\n\n')
+    for _ in range(rnd.randint(1, 4)):
+        parts.append(f'[[Категорія:{rnd.choice(WORDS).capitalize()}]]\n')
+    return ''.join(parts)
+
+
+def talk(rnd):
+    return ''.join(
+        f'\n== {rnd.choice(WORDS)} ==\n{sentence(rnd)} [[Користувач:{rnd.choice(WORDS)}]] 12:00, 1 січня 2020 (UTC)\n'
+        for _ in range(rnd.randint(1, 5))
+    )
+
+
+def fixture_page(rnd, i):
+    r = rnd.random()
+    redirect = ''
+    if r < 0.6:
+        ns, title, text = 0, f'{rnd.choice(NAMES).replace("_", " ")} {i}', article(rnd)
+    elif r < 0.75:
+        target = rnd.choice(NAMES).replace('_', ' ')
+        ns, title, text = 0, f'{rnd.choice(WORDS)} {i}', f'#перенаправлення [[{target}]]'
+        redirect = f'    <redirect title="{escape(target)}" />\n'
+    elif r < 0.9:
+        ns, title, text = 1, f'Обговорення:{rnd.choice(NAMES)} {i}', talk(rnd)
+    else:
+        ns, title, text = 2, f'Користувач:{rnd.choice(WORDS)} {i}', talk(rnd)
+    size = len(text.encode('utf-8'))
+    return f'''  <page>
+    <title>{escape(title)}</title>
+    <ns>{ns}</ns>
+    <id>{i}</id>
+{redirect}    <revision>
+      <id>{10**6 + i}</id>
+      <timestamp>2024-01-01T00:00:00Z</timestamp>
+      <contributor>
+        <username>Користувач {i % 100}</username>
+        <id>{i % 100}</id>
+      </contributor>
+      <text bytes="{size}" xml:space="preserve">{escape(text)}</text>
+      <sha1>{i:031d}</sha1>
+    </revision>
+  </page>
+'''
+
+
+def write_fixture(filename, pages, seed=1814):
+    rnd = random.Random(seed)
+    with bz2.open(filename, 'wt', encoding='utf-8') as f:
+        f.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" version="0.11" xml:lang="uk">\n')
+        f.write('  <siteinfo>\n    <sitename>Вікіпедія</sitename>\n  </siteinfo>\n')
+        for i in range(1, pages + 1):
+            f.write(fixture_page(rnd, i))
+        f.write('</mediawiki>\n')
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    res = func(*args)
+    return res, time.perf_counter() - start
+
+
+def run(fixture):
+    """Return {phase: {seconds, pages, mb}}"""
+    results = {}
+
+    def add(name, seconds, pages, mb):
+        results[name] = dict(seconds=seconds, pages=pages, mb=mb)
+
+    data, seconds = timed(decompress, fixture)
+    mb = len(data) / 1e6
+    add('decompression', seconds, None, mb)
+
+    pages, seconds = timed(lambda: [dumpscan.parse_page(raw) for raw in dumpscan.split_pages(data)])
+    add('xml parse', seconds, len(pages), mb)
+    del data
+
+    _, seconds = timed(lambda: list(dumpscan.scan(fixture)))
+    add('iter_pages', seconds, len(pages), mb)
+
+    main = [p for p in pages if p.ns == '0']
+    main_mb = sum(len(p.text.encode('utf-8')) for p in main) / 1e6
+    parsed, seconds = timed(lambda: {p.text: wikitext.links_and_headings(p.text) for p in main})
+    add('wikitext parse', seconds, len(main), main_mb)
+
+    mixes = mixes_consumer()
+    consumers = dict(
+        iter_links=lambda pages: [links.page_links(p) for p in pages],
+        comments=lambda pages: [dumpquery.comments(p) for p in pages],
+        sections_report=lambda pages: dumpquery.SectionsReport().run(pages, io.StringIO()),
+        iter_mixed=mixes and (lambda pages: [mixes(p) for p in pages]),
+    )
+    # wikitext is already parsed above, so only logic of consumers is timed
+    parse = wikitext.links_and_headings
+    wikitext.links_and_headings = parsed.__getitem__
+    try:
+        for name, func in consumers.items():
+            if func is None:
+                print(name, 'skipped, could not import it')
+                continue
+            _, seconds = timed(func, pages)
+            add(f'{name} logic', seconds, len(pages), mb)
+    finally:
+        wikitext.links_and_headings = parse
+    return results
+
+
+def mixes_consumer():
+    try:
+        from fix_layouts_mix import page_mixes
+        return page_mixes
+    except Exception as e:  # it connects to wiki on import
+        print(e, file=sys.stderr)
+
+
+def decompress(filename):
+    with bz2.open(filename) as f:
+        return f.read()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(filename, fixture):
+    previous = None
+    try:
+        with open(filename) as f:
+            for line in f:
+                record = json.loads(line)
+                if record['fixture'] == fixture:
+                    previous = record
+    except FileNotFoundError:
+        pass
+    return previous
+
+
+def print_results(results, previous=None):
+    print()
+    print(f'{"phase":<24} {"seconds":>9} {"pages/s":>10} {"MB/s":>8}  change')
+    for name, r in results.items():
+        pages = f'{r["pages"] / r["seconds"]:10.0f}' if r['pages'] and r['seconds'] else f'{"":>10}'
+        mbs = f'{r["mb"] / r["seconds"]:8.2f}' if r['seconds'] else f'{"":>8}'
+        change = ''
+        if previous and name in previous['results'] and previous['results'][name]['seconds']:
+            ratio = r['seconds'] / previous['results'][name]['seconds']
+            change = f'{(ratio - 1) * 100:+.0f}% vs {previous["commit"] or previous["date"]}'
+        print(f'{name:<24} {r["seconds"]:9.3f} {pages} {mbs}  {change}')
+
+
+if __name__ == '__main__':
+    main()
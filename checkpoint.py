@@ -0,0 +1,119 @@
+"""
+Crash-safe state of long-running bots: snapshot plus append-only journal.
+
+Snapshot is a small JSON file, that names files of its generation: backlog
+(text file, one title per line) and journal (JSON lines with changes made
+since the snapshot). Changes are appended to journal cheaply, and when it
+grows, bot writes full state as a new generation, which atomically
+replaces the old one when snapshot file is replaced.
+
+    checkpoint = Checkpoint('iwbot.json')
+    snapshot, backlog, changes = checkpoint.load()
+    checkpoint.append(dict(cursor=10))
+    checkpoint.flush()
+    if checkpoint.needs_compaction():
+        checkpoint.compact(dict(cursor=10), backlog)
+"""
+
+import os
+import json
+import threading
+
+COMPACT_SIZE = 1 << 20  # bytes of journal
+
+
+class Checkpoint:
+    """Could be used from several threads"""
+
+    def __init__(self, filename, compact_size=COMPACT_SIZE):
+        self.filename = filename
+        self.compact_size = compact_size
+        self.generation = 0
+        self.journal = None
+        self.pending = []
+        self.lock = threading.RLock()
+
+    def path(self, kind, generation=None):
+        base, _ = os.path.splitext(self.filename)
+        if generation is None:
+            generation = self.generation
+        return f'{base}-{generation}-{kind}'
+
+    def load(self):
+        """Return (snapshot, backlog, changes since snapshot), or None if nothing was saved"""
+        try:
+            with open(self.filename) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None
+        if isinstance(snapshot.get('backlog'), list):  # old format, with everything in one file
+            return snapshot, snapshot.pop('backlog'), []
+
+        self.generation = snapshot['generation']
+        with open(self.path('backlog.txt'), encoding='utf-8') as f:
+            backlog = f.read().splitlines()
+        changes = []
+        try:
+            with open(self.path('journal.jsonl'), encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        changes.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break  # last line was not written completely
+        except FileNotFoundError:
+            pass
+        return snapshot, backlog, changes
+
+    def append(self, change):
+        """Add change (JSON serializable dict) to be written with the next flush"""
+        with self.lock:
+            self.pending.append(change)
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            if self.journal is None:
+                self.journal = open(self.path('journal.jsonl'), 'a', encoding='utf-8')
+            self.journal.write(''.join(
+                json.dumps(change, ensure_ascii=False) + '\n' for change in self.pending
+            ))
+            self.journal.flush()
+            self.pending = []
+
+    def needs_compaction(self):
+        with self.lock:
+            return self.journal is not None and self.journal.tell() > self.compact_size
+
+    def compact(self, snapshot, backlog):
+        """Save full state as a new generation, dropping the journal
+
+        snapshot should already include all appended changes.
+        """
+        with self.lock:
+            self._compact(snapshot, backlog)
+
+    def _compact(self, snapshot, backlog):
+        old = self.generation
+        new = old + 1
+        backlog_path = self.path('backlog.txt', new)
+        with open(backlog_path, 'w', encoding='utf-8') as f:
+            f.writelines(title + '\n' for title in backlog)
+            f.flush()
+            os.fsync(f.fileno())
+
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump(dict(snapshot, generation=new), f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filename, self.filename)
+
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.pending = []
+        self.generation = new
+        for kind in ('backlog.txt', 'journal.jsonl'):
+            if os.path.exists(self.path(kind, old)):
+                os.remove(self.path(kind, old))
@@ -0,0 +1,44 @@
+import os
+
+from checkpoint import Checkpoint
+
+def test_checkpoint(tmp_path):
+    filename = str(tmp_path / 'bot.json')
+    checkpoint = Checkpoint(filename)
+    assert checkpoint.load() is None
+
+    checkpoint.compact(dict(cursor=0), ['А', 'Б', 'В'])
+    checkpoint.append(dict(cursor=1))
+    checkpoint.append(dict(problem=[None, 'А', 'Проблема']))
+    checkpoint.flush()
+    checkpoint.append(dict(cursor=2))  # not flushed, lost in crash
+
+    snapshot, backlog, changes = Checkpoint(filename).load()
+    assert snapshot == dict(cursor=0, generation=1)
+    assert backlog == ['А', 'Б', 'В']
+    assert changes == [dict(cursor=1), dict(problem=[None, 'А', 'Проблема'])]
+
+    checkpoint.compact(dict(cursor=2), ['А', 'Б', 'В', 'Г'])
+    snapshot, backlog, changes = Checkpoint(filename).load()
+    assert snapshot == dict(cursor=2, generation=2)
+    assert backlog == ['А', 'Б', 'В', 'Г']
+    assert changes == []
+    assert sorted(os.listdir(tmp_path)) == ['bot-2-backlog.txt', 'bot.json']
+
+def test_checkpoint_torn_journal(tmp_path):
+    filename = str(tmp_path / 'bot.json')
+    checkpoint = Checkpoint(filename, compact_size=10)
+    checkpoint.compact(dict(cursor=0), ['А'])
+    checkpoint.append(dict(cursor=1))
+    checkpoint.flush()
+    assert checkpoint.needs_compaction()
+    with open(checkpoint.path('journal.jsonl'), 'a') as f:
+        f.write('{"cursor": ')
+    assert Checkpoint(filename).load()[2] == [dict(cursor=1)]
+
+def test_checkpoint_old_format(tmp_path):
+    filename = tmp_path / 'bot.json'
+    filename.write_text('{"backlog": ["А", "Б"], "to_translate": {}, "cursor": 1}')
+    snapshot, backlog, changes = Checkpoint(str(filename)).load()
+    assert snapshot['cursor'] == 1
+    assert backlog == ['А', 'Б']
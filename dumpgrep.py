@@ -0,0 +1,113 @@
+"""
+Search of dump pages by literal strings or regular expressions, like grep.
+
+All patterns are compiled into one alternation, which is checked on the raw
+XML of page before it is parsed (when all patterns are literal and case
+sensitive) and on page text. Line numbers are found only for the pages
+that match.
+
+    python3 dumpgrep.py ukwiki-pages-articles.xml.bz2 'Кіев' 'Киев' --workers 8
+    python3 dumpgrep.py ukwiki-pages-articles.xml.bz2 -e '\\{\\{[Цц]итата' --format jsonl
+"""
+
+import re
+import sys
+import json
+import argparse
+from xml.sax.saxutils import escape
+
+import dumpscan
+
+XML_ENTITIES = {'"': '&quot;'}  # besides &, < and >
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dump')
+    parser.add_argument('literals', nargs='*', metavar='string', help='literal string to search for')
+    parser.add_argument('-e', '--regex', action='append', default=[], dest='regexes', help='regular expression to search for')
+    parser.add_argument('-i', '--ignore-case', action='store_true')
+    parser.add_argument('--namespace', action='append', dest='namespaces', help='search only in namespace, could be given several times')
+    parser.add_argument('--format', choices=['wiki', 'jsonl'], default='wiki')
+    parser.add_argument('--output', help='file to write hits to (default: stdout)')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    if not args.literals and not args.regexes:
+        parser.error('nothing to search for')
+
+    matcher = Matcher(args.literals, args.regexes, args.ignore_case)
+    hits = grep(args.dump, matcher, workers=args.workers, namespaces=args.namespaces)
+    if args.output:
+        with open(args.output, 'w') as out:
+            write_hits(hits, out, args.format)
+    else:
+        write_hits(hits, sys.stdout, args.format)
+
+
+class Matcher:
+    """Find lines of page text that match any of patterns. Works in dumpscan workers.
+
+    Returns (title, [(line number, line, pattern)]) or None for pages without matches.
+    """
+
+    def __init__(self, literals=(), regexes=(), ignore_case=False):
+        self.patterns = [*literals, *regexes]
+        if not self.patterns:
+            raise ValueError('No patterns to search for')
+        sources = [re.escape(p) for p in literals] + list(regexes)
+        self.pattern = re.compile(
+            '|'.join(f'(?P<dumpgrep_{i}>{s})' for i, s in enumerate(sources)),
+            re.I if ignore_case else 0,
+        )
+        self.raw_pattern = None
+        if literals and not regexes and not ignore_case:
+            self.raw_pattern = re.compile(b'|'.join(
+                re.escape(escape(p, XML_ENTITIES).encode('utf-8')) for p in literals
+            ))
+
+    def __call__(self, page):
+        text = page.text or ''
+        if not self.pattern.search(text):
+            return
+        return page.title, list(self.lines(text))
+
+    def lines(self, text):
+        """Yield (number, line, pattern) for lines of text where matches start"""
+        number = 1
+        counted = 0  # newlines are counted in text[:counted]
+        pos = 0
+        while m := self.pattern.search(text, pos):
+            line_start = text.rfind('\n', 0, m.start()) + 1
+            line_end = text.find('\n', m.start())
+            if line_end < 0:
+                line_end = len(text)
+            number += text.count('\n', counted, line_start)
+            counted = line_start
+            yield number, text[line_start:line_end], self.patterns[int(m.lastgroup.rsplit('_', 1)[1])]
+            pos = line_end + 1
+
+
+def grep(dump_filename, matcher, workers=1, namespaces=None):
+    """Yield (title, [(line number, line, pattern)]) of pages that match"""
+    yield from dumpscan.scan(
+        dump_filename, matcher, workers=workers, namespaces=namespaces,
+        raw_pattern=matcher.raw_pattern,
+    )
+
+
+def write_hits(hits, out, format='wiki'):
+    for title, lines in hits:
+        if format == 'jsonl':
+            for number, line, pattern in lines:
+                print(json.dumps(
+                    dict(title=title, line=number, text=line, pattern=pattern), ensure_ascii=False,
+                ), file=out)
+        else:
+            print(f'* [[{title}]]', file=out)
+            for number, line, _ in lines:
+                # escaped, as line could close the tags
+                print(f'** {number}: <code><nowiki>{escape(line)}</nowiki></code>', file=out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import json
+import io
+
+from dumpgrep import Matcher, grep, write_hits
+from dumpscan_test import write_dump, PAGES
+
+def test_matcher_lines():
+    matcher = Matcher(['Київ'], [r'\d+ рік'])
+    text = 'Київ\nнічого\n\n1990 рік, Київ\nКиїв і Київ'
+    assert list(matcher.lines(text)) == [
+        (1, 'Київ', 'Київ'),
+        (4, '1990 рік, Київ', r'\d+ рік'),
+        (5, 'Київ і Київ', 'Київ'),
+    ]
+
+def test_matcher_raw_pattern():
+    assert Matcher(['<!-- коментар']).raw_pattern.search('&lt;!-- коментар'.encode('utf-8'))
+    assert Matcher(['a'], ['b']).raw_pattern is None
+    assert Matcher(['a'], ignore_case=True).raw_pattern is None
+
+def test_grep(tmp_path):
+    filename = write_dump(tmp_path)
+    hits = list(grep(filename, Matcher(['Посилання 12]] <!--']), workers=2))
+    assert hits == [('Обговорення:Сторінка 12', [(1, 'Текст [[Посилання 12]] <!-- коментар -->', 'Посилання 12]] <!--')])]
+
+    hits = list(grep(filename, Matcher(regexes=[r'посилання \d+5\]\]'], ignore_case=True), namespaces={'0'}))
+    assert [title for title, _ in hits] == [f'Сторінка {i}' for i in range(1, PAGES + 1) if i % 3 and str(i).endswith('5') and i > 10]
+
+    out = io.StringIO()
+    write_hits(grep(filename, Matcher(['Посилання 1]]'])), out, 'jsonl')
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == [
+        dict(title='Сторінка 1', line=1, text='Текст [[Посилання 1]] <!-- коментар -->', pattern='Посилання 1]]'),
+    ]
+
+def test_write_hits_wiki():
+    out = io.StringIO()
+    write_hits([('Київ', [(3, 'a </nowiki></code> & b', 'a')])], out)
+    assert out.getvalue() == '* [[Київ]]\n** 3: <code><nowiki>a &lt;/nowiki&gt;&lt;/code&gt; &amp; b</nowiki></code>\n'
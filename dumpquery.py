@@ -1,44 +1,194 @@
+import os
 import sys
 import re
+import argparse
+from functools import cached_property
 from itertools import islice
 from collections import defaultdict, Counter
 
-from pywikibot.xmlreader import XmlDump
 import mwparserfromhell
 
+import dumpgrep
+import dumpscan
+import pagestore
+import wikitext
+
+REPORTS = {}
+
+def report(cls):
+    """Register report class under its name"""
+    REPORTS[cls.name] = cls
+    return cls
+
 def main():
-    arg = sys.argv[1]
-    # search_report(iter_pages(arg), sys.argv[2])
-    # comments_report(iter_pages(arg))
-    # mixed_names_report(iter_pages(arg))
-    sections_report(iter_pages(arg))
-
-
-def sections_report(pages):
-    sections = defaultdict(list)
-    existing_pages = set()
-    links = Counter()
-    for page in pages:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dump')
+    parser.add_argument(
+        '--report', action='append', choices=sorted(REPORTS), dest='reports',
+        help='report to build, could be given several times (default: sections)',
+    )
+    parser.add_argument('--search', help='substring for search report')
+    parser.add_argument('--output', default='.', help='directory for report files')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--store', help='keep report rows of pages in this file, and recompute only changed pages')
+    parser.add_argument('--partial', action='store_true', help='dump has only changed pages (adds-changes dump)')
+    args = parser.parse_args()
+    if 'search' in (args.reports or []) and not args.search:
+        parser.error('search report needs --search')
+
+    reports = []
+    for name in args.reports or ['sections']:
+        if name == 'search':
+            reports.append(SearchReport(args.search))
+        else:
+            reports.append(REPORTS[name]())
+    run_reports(
+        args.dump, reports, args.output, workers=args.workers,
+        store=args.store, partial=args.partial,
+    )
+
+
+def run_reports(dump_filename, reports, output='.', workers=1, store=None, partial=False):
+    """Build all reports in one pass over the dump
+
+    Every report is written to <output>/<report name>.txt
+    With store, results of unchanged pages are taken from it (see pagestore).
+    """
+    namespaces = set()
+    for r in reports:
+        if r.namespaces is None:
+            namespaces = None
+            break
+        namespaces |= r.namespaces
+
+    if store:
+        page_store = pagestore.update(
+            store, dump_filename, {r.key: r.map for r in reports}, partial=partial,
+            workers=workers, namespaces=namespaces, wrap=ParsedPage,
+        )
+        for r in reports:
+            for res in page_store.values(r.key):
+                r.add(res)
+    else:
+        results_iter = dumpscan.scan(
+            dump_filename, PageAnalyzer(reports), workers=workers, namespaces=namespaces,
+        )
+        for results in results_iter:
+            for r, res in zip(reports, results):
+                if res is not None:
+                    r.add(res)
+
+    for r in reports:
+        with open(os.path.join(output, r.name + '.txt'), 'w') as out:
+            r.write(out)
+
+
+class ParsedPage:
+    """Dump page, with wikitext parsed at most once for all reports"""
+
+    def __init__(self, page):
+        self.page = page
+
+    def __getattr__(self, name):
+        return getattr(self.page, name)
+
+    @cached_property
+    def code(self):
+        return mwparserfromhell.parse(self.page.text)
+
+
+class PageAnalyzer:
+    """Run map of every report on a page. Works in dumpscan workers."""
+
+    def __init__(self, reports):
+        self.reports = reports
+
+    def __call__(self, page):
+        page = ParsedPage(page)
+        results = [r.map(page) for r in self.reports]
+        if all(res is None for res in results):
+            return
+        return results
+
+
+class Report:
+    """Report over dump pages
+
+    map(page) is called in workers, and should not change the report.
+    Its result, if not None, is passed to add() in the main process.
+    write(out) outputs report when all pages are processed.
+    namespaces, if not None, lists the only namespaces report looks at.
+    Results of map should be JSON serializable, to be kept in pagestore.
+    """
+    name = None
+    namespaces = None
+
+    @property
+    def key(self):
+        """Name of results of map in pagestore"""
+        return self.name
+
+    def map(self, page):
+        raise NotImplementedError
+
+    def add(self, result):
+        raise NotImplementedError
+
+    def write(self, out):
+        raise NotImplementedError
+
+    def run(self, pages, out=sys.stdout):
+        for page in pages:
+            res = self.map(ParsedPage(page))
+            if res is not None:
+                self.add(res)
+        self.write(out)
+
+
+@report
+class SectionsReport(Report):
+    name = 'sections'
+    namespaces = {'0'}
+
+    def __init__(self):
+        self.sections = defaultdict(list)
+        self.existing_pages = set()
+        self.links = Counter()
+
+    def map(self, page):
         if page.ns != '0':
-            continue
-        existing_pages.add(page.title)
-        code = mwparserfromhell.parse(page.text)
-        for h in code.filter_headings():
-            sections[normalize(h.title)].append(page.title)
-        for l in code.filter_wikilinks():
-            links[normalize(l.title.split('#')[0])] += 1
-    for link, frequency in links.most_common():
-        if link in existing_pages:
-            continue
-        if link not in sections:
-            continue
-        if frequency < 2:
-            continue
-        if len(sections[link]) > 5:
-            continue
-        print(f'* [[{link}]] ({frequency})')
-        for page in sections[link]:
-            print(f'** [[{page}#{link}]]')
+            return
+        links, headings = wikitext.links_and_headings(page.text)
+        return (
+            page.title,
+            [normalize(h) for h in headings],
+            [normalize(l.split('#')[0]) for l in links],
+        )
+
+    def add(self, result):
+        title, headings, links = result
+        self.existing_pages.add(title)
+        for h in headings:
+            self.sections[h].append(title)
+        self.links.update(links)
+
+    def write(self, out):
+        for link, frequency in self.links.most_common():
+            if link in self.existing_pages:
+                continue
+            if link not in self.sections:
+                continue
+            if frequency < 2:
+                continue
+            if len(self.sections[link]) > 5:
+                continue
+            print(f'* [[{link}]] ({frequency})', file=out)
+            for page in self.sections[link]:
+                print(f'** [[{page}#{link}]]', file=out)
+
+
+def sections_report(pages, out=sys.stdout):
+    SectionsReport().run(pages, out)
 
 
 def normalize(title):
@@ -47,42 +197,99 @@ def normalize(title):
         return ''
     return s[0].upper() + s[1:]
 
-def search_report(pages, substring):
-    for page in pages:
-        for line in page.text.splitlines():
-            if substring in line:
-                print(f'[[{page.title}]]:', line)
 
+@report
+class SearchReport(Report):
+    name = 'search'
+
+    def __init__(self, substring):
+        self.substring = substring
+        self.matcher = dumpgrep.Matcher([substring])
+        self.hits = []
+
+    @property
+    def key(self):
+        return f'{self.name}:{self.substring}'
+
+    def map(self, page):
+        hits = self.matcher(page)
+        if hits:
+            return page.title, [line for _, line, _ in hits[1]]
+
+    def add(self, result):
+        self.hits.append(result)
+
+    def write(self, out):
+        for title, lines in self.hits:
+            for line in lines:
+                print(f'[[{title}]]:', line, file=out)
+
+
+def search_report(pages, substring, out=sys.stdout):
+    SearchReport(substring).run(pages, out)
+
+
+@report
+class MixedNamesReport(Report):
+    name = 'mixed_names'
 
-def mixed_names_report(pages):
-    print('{| class="wikitable sortable"')
-    print('|-')
-    print('! Назва статті !! Варіант перейменування')
-    from fix_layouts_mix import fix_page_text, find_mixes
-    for page in pages:
+    def __init__(self):
+        self.rows = []
+
+    def map(self, page):
+        from fix_layouts_mix import fix_page_text, find_mixes
         if page.ns == '0' or page.ns == '2':
-            continue
+            return
         if not find_mixes(page.title):
-            continue
+            return
         fixed_title = fix_page_text(page.title)
         if fixed_title == page.title:
             fixed_title = '???'
-        print('|-')
-        print(f'| [[{page.title}]] || [[{fixed_title}]]')
-    print('|}')
-
-
-def comments_report(pages):
-    print('{| class="wikitable sortable"')
-    print('|-')
-    print('! Назва статті !! Закоментовано % !! Закоментовано символів ')
-    for p in pages:
-        c = comments(p)
-        if not c:
-            continue
-        print('|-')
-        print(f'| [[{c["title"]}]] || {c["commented_percent"]:.1f}% || {c["commented_len"]}')
-    print('|}')
+        return page.title, fixed_title
+
+    def add(self, result):
+        self.rows.append(result)
+
+    def write(self, out):
+        print('{| class="wikitable sortable"', file=out)
+        print('|-', file=out)
+        print('! Назва статті !! Варіант перейменування', file=out)
+        for title, fixed_title in self.rows:
+            print('|-', file=out)
+            print(f'| [[{title}]] || [[{fixed_title}]]', file=out)
+        print('|}', file=out)
+
+
+def mixed_names_report(pages, out=sys.stdout):
+    MixedNamesReport().run(pages, out)
+
+
+@report
+class CommentsReport(Report):
+    name = 'comments'
+    namespaces = {'0'}
+
+    def __init__(self):
+        self.rows = []
+
+    def map(self, page):
+        return comments(page)
+
+    def add(self, result):
+        self.rows.append(result)
+
+    def write(self, out):
+        print('{| class="wikitable sortable"', file=out)
+        print('|-', file=out)
+        print('! Назва статті !! Закоментовано % !! Закоментовано символів ', file=out)
+        for c in self.rows:
+            print('|-', file=out)
+            print(f'| [[{c["title"]}]] || {c["commented_percent"]:.1f}% || {c["commented_len"]}', file=out)
+        print('|}', file=out)
+
+
+def comments_report(pages, out=sys.stdout):
+    CommentsReport().run(pages, out)
 
 def comments(page):
     if page.ns != '0':
@@ -100,14 +307,10 @@ def comments(page):
         commented_percent=commented_percent,
     )
 
-def iter_pages(dump_filename):
-    i = 0
-    for page in XmlDump(dump_filename).parse():
-        i += 1
-        if i % 123 == 0:
-            print('\033[K\r', i, page.title, file=sys.stderr, end='')
-
-        yield page
+def iter_pages(dump_filename, workers=1, namespaces=None, title_filter=None):
+    yield from dumpscan.scan(
+        dump_filename, workers=workers, namespaces=namespaces, title_filter=title_filter,
+    )
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,27 @@
+from dumpquery import run_reports, SectionsReport, SearchReport, CommentsReport
+from dumpscan_test import write_dump
+
+def test_run_reports(tmp_path):
+    filename = write_dump(tmp_path)
+    reports = [SectionsReport(), SearchReport('Посилання 12]]'), CommentsReport()]
+    run_reports(filename, reports, str(tmp_path), workers=2)
+
+    assert len(reports[0].existing_pages) == 167
+    assert reports[0].links['Посилання 1'] == 1
+    assert (tmp_path / 'search.txt').read_text() == (
+        '[[Обговорення:Сторінка 12]]: Текст [[Посилання 12]] <!-- коментар -->\n'
+    )
+    assert (tmp_path / 'comments.txt').read_text().startswith('{| class="wikitable sortable"')
+    assert (tmp_path / 'sections.txt').exists()
+
+def test_run_reports_incremental(tmp_path):
+    filename = write_dump(tmp_path)
+    store = str(tmp_path / 'pagestore.sqlite')
+    run_reports(filename, [CommentsReport()], str(tmp_path), store=store)
+    expected = (tmp_path / 'comments.txt').read_text()
+
+    # second run takes everything from store
+    reports = [SectionsReport(), CommentsReport()]
+    run_reports(filename, reports, str(tmp_path), store=store, partial=True)
+    assert (tmp_path / 'comments.txt').read_text() == expected
+    assert len(reports[0].existing_pages) == 167
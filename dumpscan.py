@@ -0,0 +1,280 @@
+"""
+Parallel scanner for MediaWiki XML dumps.
+
+Splits the dump at <page> boundaries and fans pages out to a process pool.
+When the dump is a multistream one (``*-multistream.xml.bz2`` with
+``*-multistream-index.txt.bz2`` next to it), each worker decompresses its own
+bz2 streams, so decompression is parallel too. Otherwise the main process
+decompresses the dump and workers do XML and wikitext parsing.
+
+    for links in scan('ukwiki-pages-articles.xml.bz2', get_links, workers=8):
+        ...
+"""
+
+import os
+import bz2
+import gzip
+import lzma
+from dataclasses import dataclass
+from itertools import islice
+from multiprocessing import Pool
+from html import unescape
+from xml.etree.ElementTree import fromstring
+
+from pywikibot.tools import open_archive
+from pywikibot.xmlreader import XmlEntry, XmlDump
+
+from progress import Progress
+
+BATCH_SIZE = 100  # pages per task, the same as in a multistream dump stream
+READ_SIZE = 1 << 20
+
+PAGE_START = b'<page>'
+PAGE_END = b'</page>'
+
+
+def scan(dump_filename, func=None, workers=1, ordered=True, batch_size=BATCH_SIZE,
+         namespaces=None, title_filter=None, raw_pattern=None, progress=None):
+    """Yield func(page) for every page of the dump, skipping None results.
+
+    Without func yields pages (DumpPage) themselves.
+    func should be picklable (a module level function or an instance of
+    a module level class), as it is sent to workers when the pool starts.
+    With ordered=False results come as soon as workers produce them.
+
+    namespaces (e.g. {'0'}) and title_filter (predicate on title) select pages
+    before they are parsed, so text of rejected pages is never decoded.
+    title_filter is sent to workers too, so it should be picklable like func.
+    raw_pattern (compiled bytes regex) selects pages whose XML matches it.
+
+    progress (Progress) reports pages/s, input bytes/s and ETA of the scan,
+    by default on stderr (see progress module).
+    """
+    page_filter = None
+    if namespaces is not None or title_filter is not None or raw_pattern is not None:
+        page_filter = PageFilter(namespaces, title_filter, raw_pattern)
+
+    if progress is None:
+        progress = Progress(os.path.getsize(dump_filename), label=os.path.basename(dump_filename))
+
+    index = multistream_index(dump_filename)
+    if index:
+        tasks = ((dump_filename, start, end) for start, end in stream_ranges(dump_filename, index))
+        process = _process_streams
+    else:
+        tasks = batched(iter_raw_pages(dump_filename, page_filter, progress), batch_size)
+        process = _process_pages
+
+    for count, consumed, results in _map(process, (func, page_filter), tasks, workers, ordered):
+        for res in results:
+            if res is not None:
+                yield res
+        progress.update(count, consumed=consumed)
+    progress.close()
+
+
+def _map(process, job, tasks, workers, ordered):
+    if workers <= 1:
+        for task in tasks:
+            yield process(job, task)
+        return
+
+    # job is sent to every worker once, not with every task
+    with Pool(workers, initializer=_init_worker, initargs=(process, job)) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        yield from imap(_run_task, tasks)
+
+
+_worker_job = None
+
+def _init_worker(process, job):
+    global _worker_job
+    _worker_job = (process, job)
+
+def _run_task(task):
+    process, job = _worker_job
+    return process(job, task)
+
+
+def _process_pages(job, raw_pages):
+    func, _ = job
+    results = []
+    for raw in raw_pages:
+        page = parse_page(raw)
+        results.append(func(page) if func else page)
+    return len(raw_pages), 0, results
+
+
+def _process_streams(job, task):
+    _, page_filter = job
+    filename, start, end = task
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = bz2.decompress(f.read(end - start))
+    count, _, results = _process_pages(job, list(split_pages(data, page_filter)))
+    return count, end - start, results
+
+
+class PageFilter:
+    """Select raw pages by namespace, title and XML contents, without parsing them"""
+
+    def __init__(self, namespaces=None, title_filter=None, raw_pattern=None):
+        self.namespaces = None
+        if namespaces is not None:
+            self.namespaces = {str(ns).encode() for ns in namespaces}
+        self.title_filter = title_filter
+        self.raw_pattern = raw_pattern
+
+    def __call__(self, data, start, end):
+        if self.namespaces is not None:
+            ns_start = data.find(b'<ns>', start) + len(b'<ns>')
+            ns_end = data.find(b'</ns>', ns_start)
+            if data[ns_start:ns_end] not in self.namespaces:
+                return False
+        if self.title_filter is not None:
+            title_start = data.find(b'<title>', start) + len(b'<title>')
+            title_end = data.find(b'</title>', title_start)
+            title = unescape(data[title_start:title_end].decode('utf-8'))
+            if not self.title_filter(title):
+                return False
+        if self.raw_pattern is not None:
+            if not self.raw_pattern.search(data, start, end):
+                return False
+        return True
+
+
+@dataclass
+class DumpPage(XmlEntry):
+    """XmlEntry with some more tags read"""
+
+    redirect: str = None  # redirect target title
+    size: int = None  # length of text in bytes
+    sha1: str = None  # base36 SHA-1 of text
+
+
+def parse_page(raw):
+    """Build DumpPage from bytes of one <page> element
+
+    Takes the latest revision, like XmlDump(revisions='latest'), so it works
+    for adds-changes dumps with several revisions of a page too.
+    """
+    elem = fromstring(raw)
+    edit_restriction, move_restriction = XmlDump.parse_restrictions(
+        elem.findtext('restrictions')
+    )
+    revision = max(elem.iterfind('revision'), key=lambda r: int(r.findtext('id')))
+    contributor = revision.find('contributor')
+    ip_editor = contributor.findtext('ip') if contributor is not None else None
+    username = ip_editor or (contributor.findtext('username') if contributor is not None else None)
+    redirect = elem.find('redirect')
+    text = revision.find('text')
+    size = text.get('bytes') if text is not None else None
+
+    return DumpPage(
+        title=elem.findtext('title'),
+        ns=elem.findtext('ns'),
+        id=elem.findtext('id'),
+        editRestriction=edit_restriction,
+        moveRestriction=move_restriction,
+        isredirect=redirect is not None,
+        text=revision.findtext('text'),
+        username=username or '',
+        ipedit=bool(ip_editor),
+        timestamp=revision.findtext('timestamp'),
+        revisionid=revision.findtext('id'),
+        comment=revision.findtext('comment'),
+        redirect=redirect.get('title') if redirect is not None else None,
+        size=int(size) if size is not None else None,
+        sha1=revision.findtext('sha1'),
+    )
+
+
+def split_pages(data, page_filter=None, stop=None):
+    """Yield bytes of every <page> element in data[:stop]
+
+    Pages rejected by page_filter are skipped without being copied.
+    """
+    if stop is None:
+        stop = len(data)
+    pos = 0
+    while True:
+        start = data.find(PAGE_START, pos, stop)
+        if start < 0:
+            return
+        end = data.find(PAGE_END, start, stop)
+        if end < 0:
+            return
+        pos = end + len(PAGE_END)
+        if page_filter is None or page_filter(data, start, pos):
+            yield data[start:pos]
+
+
+def iter_raw_pages(dump_filename, page_filter=None, progress=None):
+    """Decompress dump sequentially, yielding bytes of every <page> element
+
+    progress.offset is kept at the position in compressed file.
+    """
+    buf = b''
+    with open(dump_filename, 'rb') as raw, open_dump(dump_filename, raw) as source:
+        while True:
+            chunk = source.read(READ_SIZE)
+            if not chunk:
+                return
+            if progress is not None:
+                progress.offset = raw.tell()
+            buf += chunk
+            last_end = buf.rfind(PAGE_END)
+            if last_end < 0:
+                continue
+            last_end += len(PAGE_END)
+            yield from split_pages(buf, page_filter, last_end)
+            buf = buf[last_end:]
+
+
+def open_dump(dump_filename, raw):
+    """Decompressed stream of dump, reading from raw file to know offset in it
+
+    Other archives (7z) are decompressed by external program, raw file
+    stays at 0 for them.
+    """
+    if dump_filename.endswith('.bz2'):
+        return bz2.BZ2File(raw)
+    if dump_filename.endswith('.gz'):
+        return gzip.GzipFile(fileobj=raw)
+    if dump_filename.endswith('.xz'):
+        return lzma.LZMAFile(raw)
+    if dump_filename.endswith('.xml'):
+        return raw
+    return open_archive(dump_filename)
+
+
+def batched(iterable, n):
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
+
+
+def multistream_index(dump_filename):
+    """Return filename of multistream index for dump, or None"""
+    if not dump_filename.endswith('-multistream.xml.bz2'):
+        return None
+    index = dump_filename[:-len('.xml.bz2')] + '-index.txt.bz2'
+    if os.path.exists(index):
+        return index
+    return None
+
+
+def stream_ranges(dump_filename, index_filename):
+    """Yield (start, end) byte offsets of bz2 streams with pages
+
+    Index has lines like "offset:page_id:title", one per page.
+    The last range extends to the end of file, it has </mediawiki> footer.
+    """
+    offsets = []
+    with bz2.open(index_filename, 'rt', encoding='utf-8') as f:
+        for line in f:
+            offset = int(line.split(':', 1)[0])
+            if not offsets or offsets[-1] != offset:
+                offsets.append(offset)
+    offsets.append(os.path.getsize(dump_filename))
+    yield from zip(offsets, offsets[1:])
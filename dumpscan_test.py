@@ -0,0 +1,118 @@
+import os
+import bz2
+import json
+
+from pywikibot.xmlreader import XmlDump
+
+from dumpscan import scan
+from progress import Progress
+
+HEADER = '''<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" version="0.11" xml:lang="uk">
+  <siteinfo>
+    <sitename>Вікіпедія</sitename>
+  </siteinfo>
+'''
+FOOTER = '</mediawiki>\n'
+
+def page_xml(i):
+    ns = '0' if i % 3 else '1'
+    title = f'Сторінка {i}' if ns == '0' else f'Обговорення:Сторінка {i}'
+    redirect = '    <redirect title="Київ" />\n' if i % 7 == 0 else ''
+    return f'''  <page>
+    <title>{title}</title>
+    <ns>{ns}</ns>
+    <id>{i}</id>
+{redirect}    <revision>
+      <id>{1000 + i}</id>
+      <timestamp>2024-01-01T00:00:00Z</timestamp>
+      <contributor>
+        <username>Користувач</username>
+        <id>1</id>
+      </contributor>
+      <comment>правка &amp; коментар</comment>
+      <text bytes="10" xml:space="preserve">Текст [[Посилання {i}]] &lt;!-- коментар --&gt;</text>
+      <sha1>phoiac9h4m842xq45sp7s6u21eteeq1</sha1>
+    </revision>
+  </page>
+'''
+
+PAGES = 250
+
+def write_dump(tmp_path):
+    filename = tmp_path / 'ukwiki-pages-articles.xml.bz2'
+    content = HEADER + ''.join(page_xml(i) for i in range(1, PAGES + 1)) + FOOTER
+    filename.write_bytes(bz2.compress(content.encode('utf-8')))
+    return str(filename)
+
+def write_plain_dump(tmp_path):
+    filename = tmp_path / 'ukwiki-pages-articles.xml'
+    filename.write_text(HEADER + ''.join(page_xml(i) for i in range(1, PAGES + 1)) + FOOTER, encoding='utf-8')
+    return str(filename)
+
+def write_multistream_dump(tmp_path):
+    filename = tmp_path / 'ukwiki-pages-articles-multistream.xml.bz2'
+    data = bz2.compress(HEADER.encode('utf-8'))
+    index = []
+    for start in range(1, PAGES + 1, 100):
+        ids = range(start, min(start + 100, PAGES + 1))
+        index += [f'{len(data)}:{i}:Сторінка {i}\n' for i in ids]
+        data += bz2.compress(''.join(page_xml(i) for i in ids).encode('utf-8'))
+    data += bz2.compress(FOOTER.encode('utf-8'))
+    filename.write_bytes(data)
+    index_filename = tmp_path / 'ukwiki-pages-articles-multistream-index.txt.bz2'
+    index_filename.write_bytes(bz2.compress(''.join(index).encode('utf-8')))
+    return str(filename)
+
+def title(page):
+    return page.title
+
+def ends_with_5(title):
+    return title.endswith('5')
+
+def fields(page):
+    return (
+        page.title, page.ns, page.id, page.text, page.isredirect, page.revisionid,
+        page.username, page.ipedit, page.timestamp, page.comment,
+    )
+
+def test_scan_same_as_xmldump(tmp_path):
+    filename = write_dump(tmp_path)
+    expected = list(map(fields, XmlDump(filename, revisions='latest').parse()))
+    assert list(map(fields, scan(filename))) == expected
+    assert list(scan(filename, fields, workers=2, batch_size=7)) == expected
+
+def test_scan_extra_fields(tmp_path):
+    filename = write_dump(tmp_path)
+    pages = list(scan(filename))
+    assert pages[6].redirect == 'Київ'
+    assert pages[5].redirect is None
+    assert pages[0].size == 10
+
+def test_scan_multistream(tmp_path):
+    filename = write_multistream_dump(tmp_path)
+    expected = [p.title for p in XmlDump(filename, revisions='latest').parse()]
+    assert list(scan(filename, title)) == expected
+    assert list(scan(filename, title, workers=2)) == expected
+    assert sorted(scan(filename, title, workers=2, ordered=False)) == sorted(expected)
+
+def test_scan_filters(tmp_path):
+    for filename in (write_dump(tmp_path), write_multistream_dump(tmp_path)):
+        pages = list(XmlDump(filename, revisions='latest').parse())
+        expected = [p.title for p in pages if p.ns == '0' and p.title.endswith('5')]
+        found = scan(
+            filename, title, workers=2,
+            namespaces={0}, title_filter=ends_with_5,
+        )
+        assert list(found) == expected
+
+def test_scan_progress(tmp_path):
+    log = tmp_path / 'progress.jsonl'
+    for filename in (write_dump(tmp_path), write_multistream_dump(tmp_path), write_plain_dump(tmp_path)):
+        size = os.path.getsize(filename)
+        progress = Progress(size, label='test', log=log, interval=0)
+        assert len(list(scan(filename, title, workers=2, progress=progress))) == PAGES
+        assert progress.pages == PAGES
+        assert 0 < progress.offset <= size
+        metrics = [json.loads(line) for line in log.read_text().splitlines()]
+        assert metrics[-1]['done'] and metrics[-1]['pages'] == PAGES
+        assert metrics[-1]['peak_rss'] > 0
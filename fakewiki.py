@@ -0,0 +1,353 @@
+"""
+Local stand-in for ukwiki, other wikipedias and wikidata, to run bots offline.
+
+World of fake wikis is built from a fixture: pages (with text) and
+redirects of every wiki, wikidata items of pages, and ukwiki sitelinks of
+items. install() makes pywikibot.Site, Page and ItemPage serve it, for
+the things iw bot does: batched API queries, preloading, search, saving.
+Every request is counted, so efficiency of bots could be measured.
+
+    world = FakeWorld(synthetic_fixture(2000))
+    install(world)
+    import iw
+    iw.IwBot(world.backlog).run()
+    print(world.calls)
+"""
+
+import re
+import sys
+import json
+import random
+import threading
+from collections import Counter
+
+import pywikibot
+
+TALK_PREFIX = 'Обговорення:'
+WORDS = '''
+у на з до та що як за від по для не був була було року році місто село район області
+український українська історія війна культура мова народ держава церква школа університет
+'''.split()
+LANGS = ['en', 'de', 'fr', 'pl', 'es']
+PROJECT_TEMPLATES = ['{{Стаття проєкту Птахи}}', '{{Вікіпроєкт:Кінематограф}}', '{{Стаття проєкту Фізика}}']
+
+
+def capitalize(title):
+    return title[:1].upper() + title[1:]
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def submit(self):
+        return self.response
+
+
+class FakeSite:
+    """One wiki: answers API queries, preloads, searches and saves its pages"""
+
+    def __init__(self, world, code, pages=None, redirects=None, items=None):
+        self.world = world
+        self.code = code
+        self.pages = dict(pages or {})  # title: text
+        self.redirects = dict(redirects or {})  # title: target title
+        self.items = dict(items or {})  # title: wikidata item id
+        self.saves = []  # (title, summary)
+
+    def __repr__(self):
+        return f'FakeSite({self.code!r})'
+
+    def data_repository(self):
+        return self.world.repo
+
+    def simple_request(self, **params):
+        self.world.count(params['action'])
+        if params['action'] == 'wbgetentities':
+            return FakeRequest(dict(entities={i: self.world.entity(i) for i in params['ids']}))
+        if params.get('generator') == 'allpages':
+            return FakeRequest(dict(query=self.all_redirects(params)))
+        query = dict(pages=[], normalized=[], redirects=[])
+        for title in params['titles']:
+            name = capitalize(title)
+            if name != title:
+                query['normalized'].append({'from': title, 'to': name})
+            if params.get('redirects') and name in self.redirects:
+                query['redirects'].append({'from': name, 'to': self.redirects[name]})
+                name = self.redirects[name]
+            query['pages'].append(self.page_info(name))
+        return FakeRequest(dict(query=query))
+
+    def all_redirects(self, params):
+        """Answer allpages query for redirects of template namespace, the only one supported"""
+        assert params['gapnamespace'] == 10 and params['gapfilterredir'] == 'redirects'
+        redirects = [
+            {'from': title, 'to': target}
+            for title, target in sorted(self.redirects.items())
+            if title.startswith('Шаблон:')
+        ]
+        return dict(pages=[self.page_info(r['to']) for r in redirects], redirects=redirects)
+
+    def page_info(self, title):
+        if title not in self.pages:
+            return dict(title=title, missing=True)
+        info = dict(title=title)
+        if title in self.redirects:
+            info['redirect'] = True
+        if title in self.items:
+            info['pageprops'] = dict(wikibase_item=self.items[title])
+        return info
+
+    def preloadpages(self, pages, groupsize=50):
+        pages = list(pages)
+        for i in range(0, len(pages), groupsize):
+            self.world.count('preload')
+            for page in pages[i:i + groupsize]:
+                page.load(count=False)
+                if page.exists():
+                    yield page
+
+    def search(self, query, namespaces=None, **kwargs):
+        """Yield pages with text in "insource:" query, which is taken literally"""
+        self.world.count('search')
+        m = re.fullmatch(r'insource:(["/])(.*)\1', query)
+        if not m:
+            return
+        literal = m[2].replace('\\', '')
+        for title, text in list(self.pages.items()):
+            if literal in text:
+                yield FakePage(self, title)
+
+    def recentchanges(self, **kwargs):
+        """No changes are made by others in fake wiki"""
+        self.world.count('recentchanges')
+        return []
+
+    def save(self, title, text, summary):
+        self.world.count('edit')
+        with self.world.lock:
+            self.pages[title] = text
+            self.saves.append((title, summary))
+
+
+class FakeRepo(FakeSite):
+    """Wikidata, answers wbgetentities with ukwiki sitelinks"""
+
+    def __init__(self, world, sitelinks=None):
+        super().__init__(world, 'wikidata')
+        self.sitelinks = dict(sitelinks or {})  # item id: title on ukwiki or None
+
+
+class FakeWorld:
+    """All the fake wikis of fixture, with counters of API calls made to them"""
+
+    def __init__(self, fixture):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.repo = FakeRepo(self, fixture.get('sitelinks'))
+        self.sites = {
+            code: FakeSite(self, code, **site)
+            for code, site in fixture.get('sites', {}).items()
+        }
+        self.backlog_titles = fixture.get('backlog', [])
+
+    def count(self, action):
+        with self.lock:
+            self.calls[action] += 1
+
+    def site(self, code='uk', fam='wikipedia', *args, **kwargs):
+        """Replacement of pywikibot.Site"""
+        if code == 'wikidata':
+            return self.repo
+        with self.lock:
+            if code not in self.sites:
+                self.sites[code] = FakeSite(self, code)  # where all pages are missing
+            return self.sites[code]
+
+    def entity(self, item_id):
+        if item_id not in self.repo.sitelinks:
+            return dict(id=item_id, missing='')
+        title = self.repo.sitelinks[item_id]
+        return dict(id=item_id, sitelinks=dict(ukwiki=dict(title=title)) if title else {})
+
+    def backlog(self):
+        """Pages of backlog, in place of iw.backlinks_backlog"""
+        return [FakePage(self.site('uk'), title) for title in self.backlog_titles]
+
+
+class FakePage:
+    """Replacement of pywikibot.Page. Loads text on first use, unless it was preloaded"""
+
+    def __init__(self, site, title):
+        self.site = site
+        self._title = capitalize(title)
+        self._text = None
+
+    def __repr__(self):
+        return f'FakePage({self.site.code!r}, {self._title!r})'
+
+    def title(self, as_link=False, **kwargs):
+        return f'[[{self._title}]]' if as_link else self._title
+
+    def load(self, count=True):
+        if self._text is None:
+            if count:
+                self.site.world.count('page')
+            self._text = self.site.pages.get(self._title, '')
+
+    @property
+    def text(self):
+        self.load()
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
+
+    def exists(self):
+        self.load()
+        return self._title in self.site.pages
+
+    def isRedirectPage(self):
+        return self._title in self.site.redirects
+
+    def getRedirectTarget(self):
+        return FakePage(self.site, self.site.redirects[self._title])
+
+    def toggleTalkPage(self):
+        """Talk page of article; other namespaces are not known to fake wiki"""
+        if ':' in self._title:
+            return None
+        return FakePage(self.site, TALK_PREFIX + self._title)
+
+    def save(self, summary=None, **kwargs):
+        self.site.save(self._title, self.text, summary)
+
+
+class FakeSitelink:
+    def __init__(self, title):
+        self.title = title
+
+    def ns_title(self):
+        return self.title
+
+
+class FakeItemPage:
+    """Replacement of pywikibot.ItemPage"""
+
+    def __init__(self, repo, item_id):
+        self.repo = repo
+        self.id = item_id
+        self.sitelinks = {}
+
+    def get(self):
+        self.repo.world.count('wbgetentities')
+        if self.id not in self.repo.sitelinks:
+            raise pywikibot.exceptions.NoPageError(self)
+        title = self.repo.sitelinks[self.id]
+        self.sitelinks = dict(ukwiki=FakeSitelink(title)) if title else {}
+        return self
+
+    def title(self, **kwargs):
+        return self.id
+
+    @classmethod
+    def fromPage(cls, page):
+        page.site.world.count('query')
+        if page.isRedirectPage():  # as wbgetentities resolves redirects
+            page = page.getRedirectTarget()
+        item_id = page.site.items.get(page.title())
+        if item_id is None:
+            raise pywikibot.exceptions.NoPageError(page)
+        return cls(page.site.data_repository(), item_id).get()
+
+
+def install(world, setattr=setattr):
+    """Make pywikibot serve pages of the world instead of real wikis
+
+    Has to be called before iw is imported, as it connects to wiki on
+    import. Pass monkeypatch.setattr to undo this after test.
+    """
+    setattr(pywikibot, 'Site', world.site)
+    setattr(pywikibot, 'Page', FakePage)
+    setattr(pywikibot, 'ItemPage', FakeItemPage)
+    setattr(pywikibot, 'showDiff', lambda *args, **kwargs: None)
+    if 'iw' in sys.modules:
+        setattr(sys.modules['iw'], 'SITE', world.site('uk'))
+
+
+def load_fixture(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_fixture(fixture, filename):
+    with open(filename, 'w') as f:
+        json.dump(fixture, f, ensure_ascii=False)
+
+
+def synthetic_fixture(pages, seed=1814, templates_per_page=4):
+    """Build ukwiki backlog of pages with iw templates, and pages they point to
+
+    Targets of templates are of every kind iw bot deals with: translated
+    (then the template is replaced), translated under other title, not
+    translated yet, missing, redirects and pages without wikidata item.
+    Some targets are shared by many pages, like popular wanted translations.
+    """
+    rnd = random.Random(seed)
+    uk = dict(pages={}, redirects={}, items={})
+    sites = {lang: dict(pages={}, redirects={}, items={}) for lang in LANGS}
+    sitelinks = {}
+    targets = []  # (uk title wanted, lang, foreign title)
+    for i in range(max(pages // 2, 1)):
+        lang = rnd.choice(LANGS)
+        foreign = sites[lang]
+        title = f'Topic {i}'
+        uk_title = f'Тема {i}'
+        item = f'Q{1000 + i}'
+        kind = rnd.random()
+        if kind < 0.1:
+            pass  # missing
+        elif kind < 0.2:  # exists without item
+            foreign['pages'][title] = ''
+        elif kind < 0.3:  # redirect to a page with item
+            foreign['pages'][title] = f'#REDIRECT [[{title} (topic)]]'
+            foreign['redirects'][title] = f'{title} (topic)'
+            foreign['pages'][f'{title} (topic)'] = ''
+            foreign['items'][f'{title} (topic)'] = item
+            sitelinks[item] = None
+        else:
+            foreign['pages'][title] = ''
+            foreign['items'][title] = item
+            sitelinks[item] = None
+            if kind < 0.6:  # translated
+                sitelinks[item] = uk_title
+                uk['pages'][uk_title] = ''
+                uk['items'][uk_title] = item
+            elif kind < 0.65:  # translated under other title
+                sitelinks[item] = uk_title + ' (значення)'
+                uk['pages'][uk_title + ' (значення)'] = ''
+                uk['items'][uk_title + ' (значення)'] = item
+        targets.append((uk_title, lang, title))
+
+    backlog = []
+    for i in range(pages):
+        title = f'Стаття {i}'
+        parts = []
+        if rnd.random() < 0.01:
+            parts.append('{{Редагую}}')
+        for _ in range(rnd.randint(0, 2 * templates_per_page)):
+            parts.append(' '.join(rnd.choices(WORDS, k=rnd.randint(5, 30))))
+            # popular targets are more likely
+            uk_title, lang, foreign_title = targets[int(len(targets) * rnd.random() ** 2)]
+            if rnd.random() < 0.5:
+                parts.append(f'{{{{Не перекладено|{uk_title}||{lang}|{foreign_title}}}}}')
+            else:
+                parts.append(f'{{{{нп|{uk_title}|текст|{lang}|{foreign_title}}}}}')
+        parts.append(' '.join(rnd.choices(WORDS, k=20)))
+        uk['pages'][title] = ' '.join(parts)
+        if rnd.random() < 0.3:
+            uk['pages'][TALK_PREFIX + title] = rnd.choice(PROJECT_TEMPLATES)
+        backlog.append(title)
+
+    return dict(sites=dict(sites, uk=uk), sitelinks=sitelinks, backlog=backlog)
@@ -0,0 +1,146 @@
+import json
+import time
+import threading
+from datetime import datetime
+
+import pytest
+
+import fakewiki
+from templatenames import TemplateNames
+
+def fixture():
+    return dict(
+        sites=dict(
+            uk=dict(
+                pages={
+                    'Стаття': '{{Не перекладено|Київ||en|Kyiv}} та {{нп|Лавра||en|Lavra}} і {{нп|Дніпро||en|Nowhere}}',
+                    'Обговорення:Стаття': '{{Стаття проєкту Фізика}}',
+                    'Київ': '',
+                },
+                items={'Київ': 'Q1899'},
+            ),
+            en=dict(
+                pages={'Kyiv': '', 'Lavra': ''},
+                items={'Kyiv': 'Q1899', 'Lavra': 'Q1'},
+            ),
+        ),
+        sitelinks={'Q1899': 'Київ', 'Q1': None},
+        backlog=['Стаття'],
+    )
+
+def test_iw_bot_offline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    world = fakewiki.FakeWorld(fixture())
+    fakewiki.install(world, monkeypatch.setattr)
+    import iw
+    monkeypatch.setattr(iw, 'SITE', world.site('uk'))
+    monkeypatch.setattr(iw, 'TEMPLATE_NAMES', TemplateNames(world.site('uk')))
+
+    parsed = []
+    parse = iw.mwparserfromhell.parse
+    monkeypatch.setattr(iw.mwparserfromhell, 'parse', lambda text: parsed.append(text) or parse(text))
+
+    bot = iw.IwBot(world.backlog)
+    bot.last_problems_update = datetime.now()
+    assert bot.run()
+    assert len(parsed) == 1  # when it was prepared, not again when processed
+    stats = bot.wiki_cache.stats()  # prefetched once, then each looked up by find_replacement
+    assert (stats['misses'], stats['hits']) == (6, 6)
+
+    uk = world.site('uk')
+    assert uk.pages['Стаття'].startswith('[[Київ]] та {{нп|Лавра||en|Lavra}} і {{нп|Дніпро||en|Nowhere}}<!-- Проблема вікіфікації: Не знайдено сторінки [[:en:Nowhere]]')
+    assert [title for title, _ in uk.saves] == ['Стаття', f'Користувач:{iw.BOT_NAME}/Найпотрібніші переклади']
+    assert list(bot.problems) == ['phys']
+    assert bot.iw_index.top(10) == [('en', 'Lavra', 1)]
+    assert world.calls['preload'] == 1
+
+    # unchanged report is not fetched again
+    world.calls.clear()
+    assert bot.run()
+    assert world.calls['page'] == 0
+    assert world.calls['edit'] == 0
+
+    # pages that are not found anymore lost their iw templates, and are dropped from the index
+    world.backlog_titles = []
+    assert bot.run()
+    assert bot.iw_index.top(10) == []
+
+def test_problems_worker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    world = fakewiki.FakeWorld(fixture())
+    fakewiki.install(world, monkeypatch.setattr)
+    import iw
+    monkeypatch.setattr(iw, 'SITE', world.site('uk'))
+    monkeypatch.setattr(iw, 'TEMPLATE_NAMES', TemplateNames(world.site('uk')))
+    report = 'Вікіпедія:Проєкт:Фізика/' + iw.ERROR_REPORT_TITLE
+    world.site('uk').pages[report] = '{|\n|-\n| [[Стаття]] || Стара проблема || 1\n|}'
+
+    bot = iw.IwBot(lambda: [])
+    worker = iw.ProblemsWorker(bot)
+    worker.start()
+    for _ in range(100):
+        if bot.last_problems_update is not None:
+            break
+        time.sleep(0.1)
+    worker.stop()
+    worker.join(10)
+    assert not worker.is_alive()
+
+    saves = [title for title, _ in world.site('uk').saves]
+    assert saves.index('Стаття') < saves.index(report)
+    assert saves.count(report) == 1  # published when project was done, and not changed since
+    assert 'Не знайдено сторінки [[:en:Nowhere]]' in world.site('uk').pages[report]
+
+def test_problems_stopped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    world = fakewiki.FakeWorld(fixture())
+    fakewiki.install(world, monkeypatch.setattr)
+    import iw
+    monkeypatch.setattr(iw, 'SITE', world.site('uk'))
+    monkeypatch.setattr(iw, 'TEMPLATE_NAMES', TemplateNames(world.site('uk')))
+    world.site('uk').pages['Вікіпедія:Проєкт:Фізика/' + iw.ERROR_REPORT_TITLE] = '| [[Стаття]] || Проблема || 1'
+
+    bot = iw.IwBot(lambda: [])
+    stopped = threading.Event()
+    stopped.set()
+    bot.process_problems(stopped)
+    assert world.site('uk').saves == []
+    assert bot.last_problems_update is None
+
+def test_template_index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    world = fakewiki.FakeWorld(fixture())
+    fakewiki.install(world, monkeypatch.setattr)
+    import iw
+    import templateindex
+    monkeypatch.setattr(iw, 'SITE', world.site('uk'))
+    monkeypatch.setattr(iw, 'TEMPLATE_NAMES', TemplateNames(world.site('uk')))
+    uk = world.site('uk')
+    uk.pages['Стаття'] += '<!-- Проблема вікіфікації: стара -->'
+    index = templateindex.TemplateIndex()
+    index.set_page('Стаття', 0, uk.pages['Стаття'])
+    index.set_since('2026-01-01T00:00:00Z')
+
+    bot = iw.IwBot(lambda: [])
+    assert world.calls['recentchanges'] == 1
+    assert bot.backlog == ['Стаття']  # from the index, not from pages given to bot
+    bot.process_problems()
+    assert 'Стаття' in [title for title, _ in uk.saves]
+    assert world.calls['search'] == 0
+    assert world.calls['recentchanges'] == 1  # updated once per cycle, not for every use
+
+def test_load_error_keeps_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    world = fakewiki.FakeWorld(fixture())
+    fakewiki.install(world, monkeypatch.setattr)
+    import iw
+    monkeypatch.setattr(iw, 'SITE', world.site('uk'))
+    monkeypatch.setattr(iw, 'TEMPLATE_NAMES', TemplateNames(world.site('uk')))
+    snapshot = dict(generation=3, cursor=5)
+    (tmp_path / iw.HIBERNATE_FILE).write_text(json.dumps(snapshot))
+    (tmp_path / 'iwbot-3-journal.jsonl').write_text('{"cursor": 7}\n')
+
+    with pytest.raises(FileNotFoundError):  # backlog of the generation is missing
+        iw.IwBot(world.backlog)
+    assert json.loads((tmp_path / iw.HIBERNATE_FILE).read_text()) == snapshot
+    assert (tmp_path / 'iwbot-3-journal.jsonl').exists()
@@ -1,15 +1,21 @@
 import sys
 import re
+import argparse
 from functools import partial
 
 import pywikibot
-from pywikibot.xmlreader import XmlDump
 import mwparserfromhell
 
+import dumpscan
+
 def main():
-    arg = sys.argv[1]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('arg', help='dump (.bz2), list of titles (.txt) or page title')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    arg = args.arg
     if arg.endswith('.bz2'):
-        for p in iter_mixed(arg):
+        for p in iter_mixed(arg, workers=args.workers):
             print(p)
     elif arg.endswith('.txt'):
         with open(arg) as f:
@@ -142,14 +148,12 @@ ssРНК
 
 site = pywikibot.Site('uk', 'wikipedia')
 
-def iter_mixed(dump_filename):
-    i = 0
-    for page in XmlDump(dump_filename).parse():
-        i += 1
-        if i % 123 == 0:
-            print('\033[K\r', i, page.title, file=sys.stderr, end='')
+def iter_mixed(dump_filename, workers=1):
+    for mixes in dumpscan.scan(dump_filename, page_mixes, workers=workers):
+        yield from mixes
 
-        yield from find_mixes(page.text)
+def page_mixes(page):
+    return find_mixes(page.text)
 
 def find_mixes(text):
     return re.findall(mixed_re, text, re.I)
@@ -8,20 +8,29 @@ with wiki-link, if the page-to-be-translated is already translated.
 """
 
 import re, json
+import os
+import hashlib
 from datetime import datetime, timedelta
+import time
+import sqlite3
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 import itertools
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import random
 import sys
 
 import pywikibot
 import mwparserfromhell
+from mwparserfromhell.nodes import Tag, Template
 from tqdm import tqdm
 
 from constants import LANGUAGE_CODES, BOT_NAME
-
-MAX_SUPPORTED_TEXT_LEN = 300000
+from iwindex import IwIndex, canonical_title
+from checkpoint import Checkpoint
+import templateindex
+import templatenames
 
 
 def main():
@@ -74,6 +83,10 @@ DO_NOT_DISTURB_TMPLS = [
     "Edited",
 ]
 
+# Keys of template groups in TEMPLATE_NAMES, hashed once
+IWTMPLS_SET = frozenset(IWTMPLS)
+DO_NOT_DISTURB_SET = frozenset(DO_NOT_DISTURB_TMPLS)
+
 # If page name has one of this prefixes - skip it:
 TITLE_EXCEPTIONS = [
     "Обговорення:",
@@ -86,14 +99,33 @@ TITLE_EXCEPTIONS = [
 ]
 
 PROBLEMS_UPDATE_PERIOD = timedelta(hours=24)  # Update problems page every
+PROBLEMS_CHECK_INTERVAL = 60  # seconds between checks whether problems update is due
+
+PRELOAD_BATCH_SIZE = 50  # pages (and their talk pages) fetched with one request
+PREPARE_AHEAD = 100  # backlog pages fetched and resolved before they are processed
+PREPARE_WORKERS = 2
 
 SITE = pywikibot.Site("uk", "wikipedia")
+TEMPLATE_NAMES = templatenames.TemplateNames(SITE, templatenames.CACHE_FILE)
 
 class IwExc(Exception):
     def __init__(self, message):
         self.message = message
 
 
+def prepared_result(future):
+    """Result of IwBot.prepare, or nothing when it failed"""
+    try:
+        return future.result()
+    except Exception as e:
+        print("Could not prepare pages:", e)
+        return {}
+
+
+def skip_title(title):
+    return any(exc in title for exc in TITLE_EXCEPTIONS)
+
+
 def conv2wikilink(text):
     if (text.startswith("Файл:") or text.startswith("Категорія:") or
        text.startswith("File:") or text.startswith("Category:")):
@@ -101,12 +133,78 @@ def conv2wikilink(text):
     return f"[[{text}]]"
 
 
-class WikiCache:
-    """Cache requests to wiki to avoid repeated requests"""
+CACHE_FILE = "wikicache.sqlite"
+POSITIVE_TTL = timedelta(days=7)  # existing pages rarely change their wikidata items
+NEGATIVE_TTL = timedelta(days=1)  # missing pages get created by translators
+MAX_CACHE_ENTRIES = 200000  # results kept in memory, others are read from disk
+
+
+class PageData:
+    """What WikiCache knows about a page and its wikidata item"""
+
+    __slots__ = (
+        "exists",
+        "redirect",  # title of redirect target
+        "wikidata_id",
+        "uk_version",  # title of ukwiki page linked to wikidata item
+        "redirect_wikidata_id",
+        "redirect_uk_version",
+        "fetched",  # timestamp
+    )
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, exists=False, redirect=None, wikidata_id=None, uk_version=None,
+                 redirect_wikidata_id=None, redirect_uk_version=None, fetched=None):
+        self.exists = exists
+        self.redirect = redirect
+        self.wikidata_id = wikidata_id
+        self.uk_version = uk_version
+        self.redirect_wikidata_id = redirect_wikidata_id
+        self.redirect_uk_version = redirect_uk_version
+        self.fetched = fetched
+
+    def as_dict(self):
+        return {f: getattr(self, f) for f in self.FIELDS}
+
+
+def cache_key(lang, title):
+    """Key of page in WikiCache, the same for all spellings of title"""
+    return lang + ":" + canonical_title(title)
 
-    def __init__(self, filename="cache.json"):
-        self.sites = dict(d=pywikibot.Site("wikidata", "wikidata"))
-        self.cache = dict()
+
+class WikiCache:
+    """Cache requests to wiki to avoid repeated requests
+
+    Results are kept in SQLite file together with time they were fetched,
+    so restarted bot does not fetch them again. Results older than TTL
+    (shorter one for missing pages) are refetched. At most max_entries
+    recently used results are kept in memory.
+    Could be used from several threads.
+    """
+
+    def __init__(self, filename=CACHE_FILE, positive_ttl=POSITIVE_TTL, negative_ttl=NEGATIVE_TTL,
+                 max_entries=MAX_CACHE_ENTRIES, sites=None):
+        if sites is None:
+            sites = dict(d=pywikibot.Site("wikidata", "wikidata"))
+        self.sites = sites
+        self.cache = OrderedDict()  # key: PageData, least recently used first
+        self.max_entries = max_entries
+        self.hits = 0  # fresh results found in memory
+        self.disk_hits = 0  # and on disk
+        self.misses = 0  # results missing or stale
+        self.evictions = 0
+        self.positive_ttl = positive_ttl.total_seconds()
+        self.negative_ttl = negative_ttl.total_seconds()
+        self.lock = threading.RLock()  # for cache, counters and db; not held during requests
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                fetched REAL NOT NULL,
+                found INTEGER NOT NULL,
+                value TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
 
     def get_site(self, lang):
         """Get site by language"""
@@ -115,30 +213,178 @@ class WikiCache:
         return self.sites[lang]
 
     def get_page_and_wikidata(self, lang, title):
-        key = lang + ":" + title
-        if key in self.cache:
-            return self.cache[key]
+        key = cache_key(lang, title)
+        res = self.lookup(key)
+        if res is not None:
+            return res
 
         try: 
             res = self._fetch_page_and_wikidata(lang, title)
         except pywikibot.exceptions.InvalidTitleError as e:
             raise IwExc(str(e))
 
-        self.cache[key] = res
+        self.store({key: res})
+        return res
+
+    def lookup(self, key):
+        """Return cached PageData if it is not stale, None otherwise"""
+        with self.lock:
+            return self._lookup(key)
+
+    def peek(self, key):
+        """Return PageData kept in memory, e.g. just fetched, or None
+
+        Unlike lookup, it is not counted and does not check TTL.
+        """
+        with self.lock:
+            return self.cache.get(key)
+
+    def _lookup(self, key):
+        res = self.cache.get(key)
+        if res is not None:
+            self.cache.move_to_end(key)
+            counter = "hits"
+        else:
+            row = self.db.execute("SELECT fetched, value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            res = PageData(**json.loads(row[1]), fetched=row[0])
+            self.remember(key, res)
+            counter = "disk_hits"
+        ttl = self.positive_ttl if res.exists else self.negative_ttl
+        if time.time() - res.fetched >= ttl:
+            self.misses += 1
+            return None
+        setattr(self, counter, getattr(self, counter) + 1)
         return res
 
+    def remember(self, key, res):
+        """Keep result in memory, forgetting least recently used ones over the limit"""
+        self.cache[key] = res
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def store(self, results):
+        """Cache {key: PageData} fetched now"""
+        with self.lock:
+            self._store(results)
+
+    def _store(self, results):
+        now = time.time()
+        for key, res in results.items():
+            res.fetched = now
+            self.remember(key, res)
+        self.db.executemany(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+            (
+                (key, now, res.exists, json.dumps(res.as_dict(), ensure_ascii=False))
+                for key, res in results.items()
+            ),
+        )
+        self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            return self._stats()
+
+    def _stats(self):
+        return dict(
+            entries=len(self.cache),
+            hits=self.hits,
+            disk_hits=self.disk_hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+    def revalidate(self, batch_size=1000):
+        """Refetch all stale results, with batched requests"""
+        now = time.time()
+        with self.lock:
+            keys = [key for key, in self.db.execute(
+                "SELECT key FROM entries WHERE fetched < (CASE WHEN found THEN ? ELSE ? END)",
+                (now - self.positive_ttl, now - self.negative_ttl),
+            )]
+        print("Revalidating", len(keys), "cached pages")
+        for i in range(0, len(keys), batch_size):
+            try:
+                self.prefetch(key.split(":", 1) for key in keys[i:i + batch_size])
+            except pywikibot.exceptions.Error as e:
+                print("Revalidation failed, stale pages will be fetched when needed:", e)
+                return
+
+    def forget(self, keys):
+        """Drop cached results, e.g. when pages were changed"""
+        with self.lock:
+            for key in keys:
+                self.cache.pop(key, None)
+            self.db.executemany("DELETE FROM entries WHERE key = ?", ((key,) for key in keys))
+            self.db.commit()
+
     def clear(self):
-        self.cache.clear()
+        with self.lock:
+            self.cache.clear()
+            self.db.execute("DELETE FROM entries")
+            self.db.commit()
 
-    def _fetch_page_and_wikidata(self, lang, title):
-        res = dict(
-            exists=False,
-            redirect=None,
-            wikidata_id=None,
-            uk_version=None,
-            redirect_wikidata_id=None,
-            redirect_uk_version=None,
+    def prefetch(self, pairs):
+        """Fill cache for many (lang, title) pairs at once, with batched requests
+
+        Titles that could not be resolved in batch (invalid titles, items
+        that are redirects, ...) are left for get_page_and_wikidata.
+        """
+        by_lang = defaultdict(set)
+        for lang, title in pairs:
+            if "|" not in title and self.lookup(cache_key(lang, title)) is None:
+                by_lang[lang].add(title)
+
+        results = {}  # key: result without uk versions yet
+        for lang, titles in by_lang.items():
+            if lang == "d":
+                for title in titles:
+                    if re.fullmatch(r"Q\d+", title):
+                        results[cache_key("d", title)] = PageData(exists=True, wikidata_id=title)
+                continue
+            site = self.get_site(lang)
+            pages = query_titles(site, titles)
+            redirects = query_titles(
+                site, [t for t, p in pages.items() if "redirect" in p], redirects=True
+            )
+            for title, page in pages.items():
+                if "invalid" in page or "special" in page:
+                    continue
+                res = PageData()
+                if "missing" not in page:
+                    res.exists = True
+                    res.wikidata_id = page.get("pageprops", {}).get("wikibase_item")
+                if title in redirects:
+                    target = redirects[title]
+                    res.redirect = target["redirected_to"]
+                    res.redirect_wikidata_id = target.get("pageprops", {}).get("wikibase_item")
+                    res.wikidata_id = res.redirect_wikidata_id  # ItemPage.fromPage follows redirects
+                results[cache_key(lang, title)] = res
+
+        sitelinks = uk_sitelinks(
+            self.get_site("d").data_repository(),
+            {
+                item
+                for res in results.values()
+                for item in (res.wikidata_id, res.redirect_wikidata_id)
+                if item
+            },
         )
+        for key, res in list(results.items()):
+            if key.startswith("d:") and res.wikidata_id not in sitelinks:
+                del results[key]  # missing item, or a redirect to another one
+                continue
+            res.uk_version = sitelinks.get(res.wikidata_id)
+            res.redirect_uk_version = sitelinks.get(res.redirect_wikidata_id)
+        self.store(results)
+
+    def _fetch_page_and_wikidata(self, lang, title):
+        res = PageData()
 
         def get_uk_version(item):
             sl = item.sitelinks.get("ukwiki")
@@ -150,9 +396,9 @@ class WikiCache:
             repo = site.data_repository()
             item = pywikibot.ItemPage(repo, title)
             item.get()
-            res["exists"] = True
-            res["wikidata_id"] = item.id
-            res["uk_version"] = get_uk_version(item)
+            res.exists = True
+            res.wikidata_id = item.id
+            res.uk_version = get_uk_version(item)
             return res
 
         page = pywikibot.Page(self.get_site(lang), title)
@@ -160,27 +406,90 @@ class WikiCache:
         if not exists:
             return res
 
-        res["exists"] = True
+        res.exists = True
         if page.isRedirectPage():
             redirect = page.getRedirectTarget()
             try:
                 item = pywikibot.ItemPage.fromPage(redirect)
-                res["redirect_wikidata_id"] = item.id
-                res["redirect_uk_version"] = get_uk_version(item)
+                res.redirect_wikidata_id = item.id
+                res.redirect_uk_version = get_uk_version(item)
             except pywikibot.exceptions.NoPageError:
                 pass
-            res["redirect"] = redirect.title()
+            res.redirect = redirect.title()
 
         try:
             item = pywikibot.ItemPage.fromPage(page)
-            res["wikidata_id"] = item.id
-            res["uk_version"] = get_uk_version(item)
+            res.wikidata_id = item.id
+            res.uk_version = get_uk_version(item)
         except pywikibot.exceptions.NoPageError:
             pass
 
         return res
 
 
+QUERY_BATCH_SIZE = 50  # titles per API request, the limit for non-bot users
+
+
+def query_titles(site, titles, redirects=False):
+    """Return {title: page} with info and wikibase item of many pages
+
+    With redirects=True, page is the one where title redirects to, and has
+    "redirected_to" key with its title. Titles that are not redirects are omitted.
+    """
+    res = {}
+    titles = sorted(titles)
+    for i in range(0, len(titles), QUERY_BATCH_SIZE):
+        batch = titles[i:i + QUERY_BATCH_SIZE]
+        data = site.simple_request(
+            action="query",
+            titles=batch,
+            prop=["info", "pageprops"],
+            ppprop="wikibase_item",
+            redirects=redirects,
+        ).submit()
+        query = data.get("query", {})
+        pages = query.get("pages", {})
+        if isinstance(pages, dict):  # formatversion=1
+            pages = pages.values()
+        by_title = {p["title"]: p for p in pages if "title" in p}
+        normalized = {n["from"]: n["to"] for n in query.get("normalized", [])}
+        redirected = {r["from"]: r for r in query.get("redirects", [])}
+        for title in batch:
+            name = normalized.get(title, title)
+            if not redirects:
+                if name in by_title:
+                    res[title] = by_title[name]
+                continue
+            if name not in redirected:
+                continue
+            target = redirected[name]["to"]
+            if redirected[name].get("tofragment"):
+                target += "#" + redirected[name]["tofragment"]
+            res[title] = dict(
+                by_title.get(redirected[name]["to"], {"missing": True}), redirected_to=target
+            )
+    return res
+
+
+def uk_sitelinks(repo, items):
+    """Return {item id: title of ukwiki page} for those of items that have it"""
+    res = {}
+    items = sorted(items)
+    for i in range(0, len(items), QUERY_BATCH_SIZE):
+        data = repo.simple_request(
+            action="wbgetentities",
+            ids=items[i:i + QUERY_BATCH_SIZE],
+            props="sitelinks",
+            sitefilter="ukwiki",
+        ).submit()
+        for item_id, entity in data.get("entities", {}).items():
+            if "missing" in entity or "redirects" in entity:
+                continue
+            sitelink = entity.get("sitelinks", {}).get("ukwiki")
+            res[item_id] = sitelink["title"] if sitelink else None
+    return res
+
+
 NAMESPACES = [
     0,  # main
     4,  # Вікіпедія
@@ -198,7 +507,30 @@ def category_backlog():
     return cat.articles()
 
 
-def search_backlog():
+def template_index():
+    """Local index of templates, or None if it was not built"""
+    if not os.path.exists(templateindex.INDEX_FILE):
+        return None
+    return templateindex.TemplateIndex()
+
+
+def update_template_index(index):
+    """Reindex pages changed since the last update of index (if there is one)"""
+    if index is None:
+        return
+    try:
+        templateindex.update(index, SITE)
+    except pywikibot.exceptions.Error as e:
+        print("Could not update template index, it could miss recent changes:", e)
+
+
+def search_backlog(index=None):
+    """Pages with iw templates, from template index if it is given, or found with search"""
+    if index is not None:
+        return (
+            pywikibot.Page(SITE, title)
+            for title in index.pages_with(TEMPLATE_NAMES.spellings(IWTMPLS), NAMESPACES)
+        )
     return itertools.chain(
         *[
             SITE.search(
@@ -226,149 +558,332 @@ def order_backlog(last, pages):
 
 
 HIBERNATE_FILE = "iwbot.json"
+CHECKPOINT_EVERY = 50  # pages
+
+
+class ProblemsWorker(threading.Thread):
+    """Updates problems of the bot every PROBLEMS_UPDATE_PERIOD, next to the main sweep"""
+
+    def __init__(self, bot):
+        super().__init__(name="problems", daemon=True)
+        self.bot = bot
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.bot.process_problems(self.stopped)  # maybe
+            except Exception:
+                traceback.print_exc()
+            self.stopped.wait(PROBLEMS_CHECK_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
 
 
 class IwBot:
-    def __init__(self, pages):
+    def __init__(self, pages, batch_size=PRELOAD_BATCH_SIZE):
         self.pages = pages
+        self.batch_size = batch_size
         self.backlog = []
         self.problems = {}
         self.last_problems_update = None
-        self.to_translate = defaultdict(set)
         self.cursor = 0
+        self.published = {}  # title of report page: hash of text published there
+        self.lock = threading.RLock()  # for problems, published reports and checkpoint of them
+        self.problems_lock = threading.Lock()  # held while problems are updated
+        self.problems_worker = None
 
+        self.template_index = template_index()  # shared with problems worker
+        update_template_index(self.template_index)
+
+        self.checkpoint = Checkpoint(HIBERNATE_FILE)
         self.load()
-        self.backlog = order_backlog(self.backlog, pages())
+        self.backlog = order_backlog(self.backlog, self.backlog_pages())
+        self.save()  # journal refers to positions in this backlog
 
         self.wiki_cache = WikiCache()
         self.processed_pages = set()
+        self.page_projects = {}  # title: projects detected for page
+        self.iw_index = IwIndex()
 
     def save(self):
-        with open(HIBERNATE_FILE, "w") as f:
-            state = dict(
-                backlog=self.backlog,
-                to_translate={
-                    p: list(links)
-                    for p, links in self.to_translate.items()
-                },
-                cursor=self.cursor,
+        """Save full state as a new checkpoint
+
+        Problems worker appends its changes to the journal holding the lock
+        too, so none of them is dropped with the journal without getting
+        into the snapshot.
+        """
+        with self.lock:
+            problems = [
+                (project, title, message)
+                for project, pages in self.problems.items()
+                for title, messages in pages.items()
+                for message in messages
+            ]
+            self.checkpoint.compact(
+                dict(cursor=self.cursor, problems=problems, published=dict(self.published)),
+                self.backlog,
             )
-            json.dump(state, f, ensure_ascii=False, indent=" ")
+
+    def save_progress(self):
+        """Append cursor and problems found since the last call to checkpoint journal"""
+        self.checkpoint.append(dict(cursor=self.cursor))
+        self.checkpoint.flush()
+        if self.checkpoint.needs_compaction():
+            self.save()
 
     def load(self):
-        try:
-            print("loading", HIBERNATE_FILE)
-            with open(HIBERNATE_FILE) as f:
-                data = json.load(f)
-                self.backlog = data["backlog"]
-                print("loaded", len(self.backlog), "page titles")
-                self.to_translate = defaultdict(set)
-                for k, v in data["to_translate"].items():
-                    self.to_translate[k] = set(v)
-                self.cursor = data["cursor"]
-            return True
-        except Exception as e:
-            print(e)
+        """Load saved state, return whether there was any
+
+        Errors are not ignored, as __init__ saves the state right after,
+        which would remove the files that could not be read.
+        """
+        print("loading", HIBERNATE_FILE)
+        state = self.checkpoint.load()
+        if state is None:
             return False
+        snapshot, self.backlog, changes = state
+        print("loaded", len(self.backlog), "page titles")
+        self.cursor = snapshot["cursor"]
+        for project, title, message in snapshot.get("problems", []):
+            self.record_problem(project, title, message)
+        self.published = snapshot.get("published", {})
+        for change in changes:
+            if "cursor" in change:
+                self.cursor = change["cursor"]
+            elif "problem" in change:
+                self.record_problem(*change["problem"])
+            elif "problems_reset" in change:
+                self.problems = {}
+            elif "published" in change:
+                title, digest = change["published"]
+                self.published[title] = digest
+        return True
 
     def reset(self):
-        self.wiki_cache.clear()
-        self.backlog = order_backlog(self.backlog, self.pages())
+        self.wiki_cache.revalidate()
+        update_template_index(self.template_index)
+        pages = list(self.backlog_pages())
+        self.backlog = order_backlog(self.backlog, pages)
         self.cursor = 0
-        self.to_translate = defaultdict(set)
+        self.page_projects = {}
+        # backlog keeps pages once found, other pages have no iw templates anymore
+        self.iw_index.keep_only(p.title() for p in pages)
+        self.save()
+
+    def backlog_pages(self):
+        """Pages with iw templates, from template index if it was built, or from pages given to bot"""
+        if self.template_index is not None:
+            return search_backlog(self.template_index)
+        return self.pages()
+
+    def start_problems_worker(self):
+        if self.problems_worker is None or not self.problems_worker.is_alive():
+            self.problems_worker = ProblemsWorker(self)
+            self.problems_worker.start()
+
+    def stop_problems_worker(self):
+        if self.problems_worker is not None:
+            self.problems_worker.stop()
+            self.problems_worker.join()  # it stops after the page it processes
 
     def run(self):
+        self.start_problems_worker()
+        pool = ThreadPoolExecutor(PREPARE_WORKERS)
         try:
             with tqdm(total=len(self.backlog), initial=self.cursor) as pbar:
+                prepared = {}  # backlog index of batch start: future of prepared pages
                 while self.cursor < len(self.backlog):
+                    first = self.cursor - self.cursor % self.batch_size
+                    end = min(self.cursor + PREPARE_AHEAD, len(self.backlog))
+                    for start in range(first, end, self.batch_size):
+                        if start not in prepared:
+                            batch = self.backlog[start:start + self.batch_size]
+                            prepared[start] = pool.submit(self.prepare, batch)
                     title = self.backlog[self.cursor]
-                    self.process_step(title)
+                    self.process_step(title, prepared_result(prepared[first]))
                     self.cursor += 1
+                    if self.cursor % self.batch_size == 0:
+                        del prepared[first]
+                    if self.cursor % CHECKPOINT_EVERY == 0:
+                        self.save_progress()
                     pbar.update(1)
                     pbar.set_postfix(page=f'{title:_<40.40s}')
-                    self.process_problems()  # maybe
             self.publish_stats()
+            print("Cache:", self.wiki_cache.stats())
             self.reset()
             return True
         except KeyboardInterrupt:
+            print("Waiting for problems update to stop")
+            self.stop_problems_worker()
             print("Saving work")
             self.save()
             print("Stopping")
             return False
+        finally:
+            # pages prepared ahead are not processed yet, cursor stays before them
+            pool.shutdown(wait=False, cancel_futures=True)
 
     def run_forever(self):
         while self.run():
             pass
 
-    def process_problems(self):
-        if self.last_problems_update is not None and (
-            datetime.now() - self.last_problems_update < PROBLEMS_UPDATE_PERIOD
+    def problems_due(self):
+        return self.last_problems_update is None or (
+            datetime.now() - self.last_problems_update >= PROBLEMS_UPDATE_PERIOD
+        )
+
+    def process_problems(self, stopped=None):
+        """Reprocess pages with problems and publish reports, if it is time to
+
+        Pages listed in the report of each project are processed first, and
+        the report is published when they are done. Then pages found by
+        search of problem comments, after which the reports that changed
+        are published again. When stopped (threading.Event) is set, returns
+        after the current page, without publishing reports it did not finish.
+        """
+        if not self.problems_due() or not self.problems_lock.acquire(blocking=False):
+            return  # updated problems not so far ago, or they are being updated
+        try:
+            with self.lock:
+                self.problems = {}
+                self.page_projects = {}  # talk pages could get new project templates
+                self.checkpoint.append(dict(problems_reset=True))
+
+            done = set()
+            for pn, project in PROJECTS.items():
+                titles = [t for t in order_backlog([], project_problem_pages(pn)) if t not in done]
+                self.process_titles(titles, stopped)  # talk pages are preloaded in batches
+                if stopped is not None and stopped.is_set():
+                    return
+                done.update(titles)
+                self.publish(project['page'] + '/' + ERROR_REPORT_TITLE, self.format_problems(pn))
+
+            searched = searched_problem_pages(self.template_index)
+            titles = [t for t in order_backlog([], searched) if t not in done]
+            self.process_titles(titles, stopped)
+            if stopped is not None and stopped.is_set():
+                return
+            self.update_problems()
+        finally:
+            self.problems_lock.release()
+
+    def prepare(self, titles):
+        """Preload pages with their talk pages and resolve their iw templates
+
+        Runs in threads, while main thread processes and saves pages before them.
+        Returns {title: (page, talk page, scan_templates result)}, so pages
+        are not parsed again when they are processed.
+        """
+        pages = [pywikibot.Page(SITE, title) for title in titles if not skip_title(title)]
+        talk_pages = [p.toggleTalkPage() for p in pages]
+        for _ in SITE.preloadpages(
+            pages + [tp for tp in talk_pages if tp is not None], groupsize=self.batch_size,
         ):
-            return  # updated problems not so far ago
-        self.wiki_cache.clear()
-        self.problems = {}
+            pass  # texts are loaded into the given page objects
+
+        scans = {}
+        for page in pages:
+            if page.exists():
+                scans[page.title()] = scan_templates(remove_problem_comments(page.text))
+        self.prefetch(t for disturb, templates in scans.values() if not disturb for t in templates)
+        return {page.title(): (page, tp, scans.get(page.title())) for page, tp in zip(pages, talk_pages)}
 
-        problem_titles = order_backlog([], list_problem_pages())
-        for title in (pbar := tqdm(problem_titles)):
-            pbar.set_postfix(page=f'{title:_<40.40s}')
-            self.process_step(title)
-        self.update_problems()
+    def process_titles(self, titles, stopped=None):
+        """Process pages out of backlog, e.g. ones affected by recent changes
 
-    def process_step(self, title):
+        Stops between pages when stopped (threading.Event) is set.
+        """
+        pbar = tqdm(total=len(titles))
+        for i in range(0, len(titles), self.batch_size):
+            if stopped is not None and stopped.is_set():
+                break
+            batch = titles[i:i + self.batch_size]
+            try:
+                prepared = self.prepare(batch)
+            except Exception as e:
+                print("Could not prepare pages:", e)
+                prepared = {}
+            for title in batch:
+                if stopped is not None and stopped.is_set():
+                    break
+                pbar.set_postfix(page=f'{title:_<40.40s}')
+                self.process_step(title, prepared)
+                pbar.update(1)
+            self.checkpoint.flush()
+        pbar.close()
+
+    def process_step(self, title, prepared=None):
+        """Process page, taking it from prepared (result of prepare) if it is there"""
+        page, talk_page, scanned = (prepared or {}).get(title, (None, None, None))
         while True:
-            page = pywikibot.Page(SITE, title)
+            if page is None:
+                page = pywikibot.Page(SITE, title)
             try:
-                self.process(page)
+                self.process(page, scanned, talk_page)
                 break
             except pywikibot.exceptions.EditConflictError as e:
                 print("Edit conflict, trying again")
+                page = scanned = None
             except Exception as e:
-                self.add_problem(page, "Неочікувана помилка: %s %s" % (type(e), e))
+                self.add_problem(page, "Неочікувана помилка: %s %s" % (type(e), e), talk_page)
                 break
 
     def publish_stats(self):
-        page = pywikibot.Page(
-            SITE,
-            f"Користувач:{BOT_NAME}/Найпотрібніші переклади",
-        )
-        update_page(page, self.format_top(), "Автоматичне оновлення таблиць")
+        self.publish(f"Користувач:{BOT_NAME}/Найпотрібніші переклади", self.format_top())
 
     def update_problems(self):
         for pn, project in PROJECTS.items():
-            page = pywikibot.Page(SITE, project['page'] + '/' + ERROR_REPORT_TITLE)
-            update_page(page, self.format_problems(pn), "Автоматичне оновлення таблиць")
+            self.publish(project['page'] + '/' + ERROR_REPORT_TITLE, self.format_problems(pn))
 
         self.last_problems_update = datetime.now()
 
-    def process(self, page):
-        """Process page to remove unnecessary iw templates"""
+    def publish(self, title, text):
+        """Update report page, unless this text was already published there"""
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self.lock:
+            if self.published.get(title) == digest:
+                return  # not even fetched
+        update_page(pywikibot.Page(SITE, title), text, "Автоматичне оновлення таблиць")
+        with self.lock:
+            self.published[title] = digest
+            self.checkpoint.append(dict(published=[title, digest]))
+
+    def process(self, page, scanned=None, talk_page=None):
+        """Process page to remove unnecessary iw templates
+
+        scanned is the result of scan_templates for the page text without
+        problem comments, if it was already parsed. talk_page is preloaded
+        talk page, to detect projects of problems with.
+        """
         title = page.title()
-        for exc in TITLE_EXCEPTIONS:
-            if exc in title:
-                print("Skipping page because of title")
-                return
-            
-        new_text = page.text
-        new_text = re.sub(
-            rf"<!-- Проблема вікіфікації: .+?-->", "", new_text
-        )
+        if skip_title(title):
+            print("Skipping page because of title")
+            return
+
+        new_text = remove_problem_comments(page.text)
         summary = set()
 
-        code = mwparserfromhell.parse(new_text)
-        if do_not_disturb(code):
+        prepared = scanned is not None  # then prepare prefetched its templates too
+        if not prepared:
+            scanned = scan_templates(new_text)
+        disturb, templates = scanned
+        if disturb:
             print("Skipping because of edit template")
             return
 
-        for tmpl in iw_templates(code):
-            if len(page.text) > MAX_SUPPORTED_TEXT_LEN:
-                print("Skipping", title, "because of size", len(page.text), "characters")
-                return
+        if not prepared:
+            self.prefetch(templates)
+        left = []  # (uk_title, lang, external_title, wanted) of templates that stay on page
+        replacements = {}  # template code: its replacement, to be applied in one pass
+        for tmpl in templates:
             replacement = False
             problem = False
             try:
                 replacement = self.find_replacement(tmpl, title)
             except IwExc as e:
-                self.add_problem(page, e.message)
+                self.add_problem(page, e.message, talk_page)
                 problem = (
                     str(tmpl)
                     + "<!-- Проблема вікіфікації: "
@@ -381,15 +896,24 @@ class IwBot:
                     page,
                     "Неочікувана помилка (%s %s) при роботі з шаблоном %s"
                     % (type(e), e, tmpl),
+                    talk_page,
                 )
 
             if replacement:
-                new_text = new_text.replace(str(tmpl), replacement)
+                replacements.setdefault(str(tmpl), replacement)
                 summary.add(REPLACE_SUMMARY)
+            else:
+                uk_title, _, lang, external_title = get_params(tmpl)
+                there = self.wiki_cache.peek(cache_key(lang, external_title)) if uk_title else None
+                wanted = there is not None and there.exists
+                left.append((uk_title, lang, external_title, wanted))
             if problem:
-                new_text = new_text.replace(str(tmpl), problem)
+                replacements.setdefault(str(tmpl), problem)
                 summary.add("[[Шаблон:Не_перекладено/документація#Якщо_бот_робить_зауваження|проблеми вікіфікації]]")
 
+        new_text = replace_all(new_text, replacements)
+        self.iw_index.set_page(title, left)
+
         # avoid duplication of comments
         new_text = deduplicate_comments(new_text)
 
@@ -414,6 +938,18 @@ class IwBot:
             raise e
 
 
+    def prefetch(self, templates):
+        """Resolve pages of all iw templates with batched requests, to fill the cache"""
+        pairs = []
+        for tmpl in templates:
+            uk_title, _, lang, external_title = get_params(tmpl)
+            if lang in LANGUAGE_CODES and uk_title:
+                pairs += [(lang, external_title), ("uk", uk_title)]
+        try:
+            self.wiki_cache.prefetch(pairs)
+        except pywikibot.exceptions.Error as e:
+            print("Batch prefetch failed, fetching one by one:", e)
+
     def find_replacement(self, tmpl, title):
         """Return string to which template should be replaced, if it should
         Return None or other falsy value otherwise.
@@ -427,13 +963,11 @@ class IwBot:
 
         there = self.wiki_cache.get_page_and_wikidata(lang, external_title)
         here = self.wiki_cache.get_page_and_wikidata("uk", uk_title)
-        if not there["exists"]:
+        if not there.exists:
             raise IwExc(f"Не знайдено сторінки [[:{lang}:{external_title}]]")
 
-        self.to_translate[f"{lang}:{external_title}"].add(title)
-
-        if not (there["wikidata_id"] or there["redirect_wikidata_id"]):
-            if here["exists"]:
+        if not (there.wikidata_id or there.redirect_wikidata_id):
+            if here.exists:
                 raise IwExc(
                     f"Сторінка [[:{lang}:{external_title}]] не має пов'язаного елемента вікіданих"
                 )
@@ -442,21 +976,21 @@ class IwBot:
                     None  # this is not a big deal, maybe they will create it before us
                 )
 
-        if here["exists"]:
-            if (here["wikidata_id"] is not None) and (
-                (here["wikidata_id"] == there["wikidata_id"])
-                or (here["wikidata_id"] == there["redirect_wikidata_id"])
+        if here.exists:
+            if (here.wikidata_id is not None) and (
+                (here.wikidata_id == there.wikidata_id)
+                or (here.wikidata_id == there.redirect_wikidata_id)
             ):
                 return f"[[{uk_title}|{text}]]"
             elif (
-                here["redirect"]
-                and (here["redirect_wikidata_id"] is not None)
+                here.redirect
+                and (here.redirect_wikidata_id is not None)
                 and (
-                    (here["redirect_wikidata_id"] == there["wikidata_id"])
-                    or (here["redirect_wikidata_id"] == there["redirect_wikidata_id"])
+                    (here.redirect_wikidata_id == there.wikidata_id)
+                    or (here.redirect_wikidata_id == there.redirect_wikidata_id)
                 )
             ):  # where we redirect to is bound to their article
-                # return f"[[{here['redirect']}|{text}]]"
+                # return f"[[{here.redirect}|{text}]]"
                 return f"[[{uk_title}|{text}]]"
             else:
                 error_msg = (
@@ -465,99 +999,101 @@ class IwBot:
                 )
                 raise IwExc(error_msg)
         else:
-            if there["uk_version"]:
+            if there.uk_version:
                 pagelink = f"[[:{lang}:{external_title}]]"
-                if there["redirect"]:
-                    pagelink += f' (→ [[:{lang}:{there["redirect"]}]])'
+                if there.redirect:
+                    pagelink += f' (→ [[:{lang}:{there.redirect}]])'
                 error_msg = (
                     f"Сторінка {pagelink} перекладена як "
-                    f"{conv2wikilink(there['uk_version'])}, "
+                    f"{conv2wikilink(there.uk_version)}, "
                     f"хоча хотіли {conv2wikilink(uk_title)}"
                 )
                 raise IwExc(error_msg)
-            if there["redirect_uk_version"]:
+            if there.redirect_uk_version:
                 pagelink = f"[[:{lang}:{external_title}]]"
-                if there["redirect"]:
-                    pagelink += f' (→ [[:{lang}:{there["redirect"]}]])'
+                if there.redirect:
+                    pagelink += f' (→ [[:{lang}:{there.redirect}]])'
                 error_msg = (
                     f"Сторінка {pagelink} перекладена як "
-                    f"{conv2wikilink(there['redirect_uk_version'])}, "
+                    f"{conv2wikilink(there.redirect_uk_version)}, "
                     f"хоча хотіли {conv2wikilink(uk_title)}"
                 )
                 raise IwExc(error_msg)
 
-    def add_problem(self, page, message):
+    def add_problem(self, page, message, talk_page=None):
         print("\n\t>>> " + message)
 
         page_title = page.title()
-        for page_project in  list(detect_projects(page)) or [None]:
-            if not page_project in self.problems:
-                self.problems[page_project] = {}
+        projects = self.page_projects.get(page_title)
+        if projects is None:
+            projects = self.page_projects[page_title] = list(detect_projects(page, talk_page)) or [None]
+        for page_project in projects:
+            with self.lock:
+                self.record_problem(page_project, page_title, message)
+                self.checkpoint.append(dict(problem=[page_project, page_title, message]))
 
-            if not page_title in self.problems[page_project]:
-                self.problems[page_project][page_title] = []
+    def record_problem(self, project, page_title, message):
+        with self.lock:
+            if not project in self.problems:
+                self.problems[project] = {}
 
-            self.problems[page_project][page_title].append(message)
+            if not page_title in self.problems[project]:
+                self.problems[project][page_title] = []
+
+            self.problems[project][page_title].append(message)
 
     def format_top(self, n=500):
-        top = f'Потребують перекладу {len(self.to_translate)} різних сторінок.\n'
-        top += f'{n} найпотрібніших перекладів:\n'
-        top += '{| class="standard sortable"\n'
-        top += "! Сторінка до перекладу || N\n"
-        tt = [(page, len(links)) for page, links in self.to_translate.items()]
-        tt.sort(key=lambda x: (-x[1], x[0]))
-        for page, n in tt[:n]:
-            top += "|-\n| [[:%s]] || %d\n" % (page, n)
-        top += "|}"
-        return top
+        """Table of n most wanted translations, selected by the index with ORDER BY ... LIMIT"""
+        lines = [
+            f'Потребують перекладу {self.iw_index.wanted_count()} різних сторінок.',
+            f'{n} найпотрібніших перекладів:',
+            '{| class="standard sortable"',
+            "! Сторінка до перекладу || N",
+        ]
+        for lang, title, pages in self.iw_index.top(n):
+            lines.append("|-")
+            lines.append("| [[:%s:%s]] || %d" % (lang, title, pages))
+        lines.append("|}")
+        return "\n".join(lines)
 
     def format_problems(self, project):
-        problems = self.problems.get(project)
-        probl = '{| class="standard sortable"\n'
-        probl += "! Стаття з проблемами || Опис проблеми || N\n"
-        for problem in sorted(self.problems.get(project, {}).keys()):
-            Nproblems = 0
-            tablAppend = ""
-            for prob in self.problems[project][problem]:
-                Nproblems += 1
-                if Nproblems == 1:
-                    firstMessage = prob
-                else:
-                    tablAppend += "|-\n| %s\n" % prob
-            if Nproblems == 0:
+        lines = [
+            '{| class="standard sortable"',
+            "! Стаття з проблемами || Опис проблеми || N",
+        ]
+        with self.lock:
+            problems = {
+                title: list(messages) for title, messages in self.problems.get(project, {}).items()
+            }
+        for problem in sorted(problems):
+            messages = problems[problem]
+            if not messages:
                 continue  # no problems
 
-            problemText = conv2wikilink(problem)
-
-            if Nproblems == 1:
-                probl += "|-\n| %s || %s || %d\n" % (
-                    problemText,
-                    firstMessage,
-                    Nproblems,
-                )
-            else:
-                probl += '|-\n| rowspan="%d" | %s || %s || rowspan="%d" | %d\n' % (
-                    Nproblems,
-                    problemText,
-                    firstMessage,
-                    Nproblems,
-                    Nproblems,
-                )
-                probl += tablAppend
-        probl += "|}"
-
-        see_also = '\n'.join(
+            lines.append("|-")
+            if len(messages) == 1:
+                lines.append("| %s || %s || %d" % (conv2wikilink(problem), messages[0], 1))
+                continue
+            lines.append('| rowspan="%d" | %s || %s || rowspan="%d" | %d' % (
+                len(messages),
+                conv2wikilink(problem),
+                messages[0],
+                len(messages),
+                len(messages),
+            ))
+            for message in messages[1:]:
+                lines.append("|-")
+                lines.append("| %s" % message)
+        lines.append("|}")
+
+        lines += ["", "== Див. також =="]
+        lines += [
             f'* [[{pr["page"]}/{ERROR_REPORT_TITLE}]]'
             for k, pr in PROJECTS.items()
             if k != project
-        )
-        probl = f"""{probl}
-
-== Див. також ==
-{see_also}
-
-[[Категорія:Упорядкування Вікіпедії]]"""
-        return probl
+        ]
+        lines += ["", "[[Категорія:Упорядкування Вікіпедії]]"]
+        return "\n".join(lines)
 
 
 LANGUAGE_MAPPINGS = dict(  # common language code mistakes
@@ -620,31 +1156,55 @@ def update_page(page, new_text, comment):
 
 
 def name_in_list(name, lst):
-    n = name.strip()
-    return (n[0].upper() + n[1:]) in lst
-
-def do_not_disturb(code):
-    for tmpl in code.filter_templates():
-        if name_in_list(tmpl.name, DO_NOT_DISTURB_TMPLS):
-            return True
-    return False
+    """Whether template name is one of lst, or a redirect to one of them"""
+    return TEMPLATE_NAMES.in_group(name, lst)
+
+def scan_templates(code):
+    """Return (whether there is a do not disturb template, list of iw templates) of wikicode
+
+    Walks the parsed code once. Gallery contents are not parsed by
+    mwparserfromhell, so descriptions of its images are parsed separately.
+    """
+    code = mwparserfromhell.parse(code)
+    iw_names = TEMPLATE_NAMES.group(IWTMPLS_SET)  # canonical names, with redirects followed
+    disturb_names = TEMPLATE_NAMES.group(DO_NOT_DISTURB_SET)
+    disturb = False
+    templates = []
+    for node in code.ifilter(forcetype=(Template, Tag)):
+        if isinstance(node, Tag):
+            if str(node.tag) == "gallery":
+                templates.extend(gallery_templates(node))
+            continue
+        name = TEMPLATE_NAMES.resolve(node.name)
+        if name in iw_names:
+            templates.append(node)
+        elif name in disturb_names:
+            disturb = True
+    return disturb, templates
+
+def gallery_templates(tag):
+    for l in str(tag.contents).splitlines():
+        if not "|" in l:
+            continue
+        _, desc = l.split("|", 1)
+        if "{{" in desc:
+            yield from iw_templates(desc)
 
 def iw_templates(code):
-    for tmpl in code.filter_templates():
-        if name_in_list(tmpl.name, IWTMPLS):
-            yield tmpl
+    return scan_templates(code)[1]
 
-    for tag in code.filter_tags():
-        if str(tag.tag) != "gallery":
-            continue
+def replace_all(text, replacements):
+    """Replace all occurrences of replacements keys in text with their values, in one pass"""
+    if not replacements:
+        return text
+    pattern = re.compile("|".join(
+        re.escape(s) for s in sorted(replacements, key=len, reverse=True)
+    ))
+    return pattern.sub(lambda m: replacements[m[0]], text)
 
-        for l in str(tag.contents).splitlines():
-            if not l.strip():
-                continue
-            if not "|" in l:
-                continue
-            _, desc = l.split("|", 1)
-            yield from iw_templates(mwparserfromhell.parse(desc))
+
+def remove_problem_comments(text):
+    return re.sub(rf"<!-- Проблема вікіфікації: .+?-->", "", text)
 
 
 def deduplicate_comments(text):
@@ -656,16 +1216,27 @@ def deduplicate_comments(text):
     return text
 
 
-def list_problem_pages():
-    for pn, project in PROJECTS.items():
-        pp = pywikibot.Page(SITE, project['page'] + '/' + ERROR_REPORT_TITLE)
-        titles = re.findall(r'^\| (?:rowspan="\d+" \| )?\[\[([^\]]+)]]', pp.text, re.M)
-        for title in titles:
-            yield pywikibot.Page(SITE, title)
+def list_problem_pages(index=None):
+    for pn in PROJECTS:
+        yield from project_problem_pages(pn)
+    yield from searched_problem_pages(index)
+
 
-    for page in SITE.search("insource:/\<!-- Проблема вікіфікації/"):
-        if page.title() not in titles:
-            yield page
+def project_problem_pages(project):
+    """Pages listed in the problems report of project"""
+    pp = pywikibot.Page(SITE, PROJECTS[project]['page'] + '/' + ERROR_REPORT_TITLE)
+    titles = re.findall(r'^\| (?:rowspan="\d+" \| )?\[\[([^\]]+)]]', pp.text, re.M)
+    for title in titles:
+        yield pywikibot.Page(SITE, title)
+
+
+def searched_problem_pages(index=None):
+    """Pages with comments about problems left by the bot, from template index if it is given"""
+    if index is not None:
+        for title in index.marked_pages(templateindex.PROBLEM_MARKER):
+            yield pywikibot.Page(SITE, title)
+        return
+    yield from SITE.search(r"insource:/\<!-- Проблема вікіфікації/")
 
 
 PROJECTS = dict(
@@ -732,20 +1303,31 @@ PROJECTS[None] = dict(
     page = f'Користувач:{BOT_NAME}'
 )
 
+# Patterns of all projects in one regex, project of the match is in the name of its group
+PROJECTS_RE = re.compile(
+    '|'.join(
+        f"(?P<project_{pn}>{project['pattern']})"
+        for pn, project in PROJECTS.items()
+        if 'pattern' in project
+    ),
+    re.IGNORECASE,
+)
+
 from icecream import ic
-def detect_projects(p):
-    tp = p.toggleTalkPage()
+def detect_projects(p, tp=None):
+    if tp is None:
+        tp = p.toggleTalkPage()
+    talk_text = tp.text if tp is not None and tp.exists() else ""
+    title = p.title()
+    in_talk = {m.lastgroup[len('project_'):] for m in PROJECTS_RE.finditer(talk_text)}
     for pn, project in PROJECTS.items():
-        title = p.title()
         if project['page'] in title: 
             yield pn
             continue
         for alias in project.get('aliases', []):
             if alias in title:
                 yield pn
-        if 'pattern' not in project:
-            continue
-        if re.findall(project['pattern'], tp.text, re.IGNORECASE):
+        if pn in in_talk:
             yield pn
 
 if __name__ == "__main__":
@@ -1,7 +1,16 @@
+import pytest
 import mwparserfromhell
 
+import iw
 from iw import get_params, deduplicate_comments
 from constants import BOT_NAME
+from templatenames import TemplateNames
+
+
+@pytest.fixture(autouse=True)
+def template_names(monkeypatch):
+    """Names of templates without redirects, which are not fetched from wiki"""
+    monkeypatch.setattr(iw, 'TEMPLATE_NAMES', TemplateNames())
 
 def parse_tmpl(text):
     code = mwparserfromhell.parse(text)
@@ -51,3 +60,157 @@ def test_get_params():
 def test_deduplicate_comments():
     assert deduplicate_comments(f'<!-- Проблема вікіфікації: ggg ({BOT_NAME})--><!-- Проблема вікіфікації: ggg ({BOT_NAME})-->') == ( f'<!-- Проблема вікіфікації: ggg ({BOT_NAME})-->'
     )
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def submit(self):
+        return self.response
+
+
+class FakeSite:
+    """Answers API requests from {(action, title or id): value}"""
+
+    def __init__(self, pages=None, redirects=None, entities=None):
+        self.pages = pages or {}
+        self.redirects = redirects or {}
+        self.entities = entities or {}
+        self.requests = []
+
+    def data_repository(self):
+        return self
+
+    def simple_request(self, **params):
+        self.requests.append(params)
+        if params['action'] == 'wbgetentities':
+            return FakeRequest(dict(entities={
+                i: self.entities.get(i, dict(id=i, missing='')) for i in params['ids']
+            }))
+        query = dict(pages=[], normalized=[], redirects=[])
+        for title in params['titles']:
+            name = title[0].upper() + title[1:]
+            if name != title:
+                query['normalized'].append({'from': title, 'to': name})
+            if params.get('redirects') and name in self.redirects:
+                query['redirects'].append({'from': name, 'to': self.redirects[name]})
+                name = self.redirects[name]
+            query['pages'].append(self.pages.get(name, dict(title=name, missing=True)))
+        return FakeRequest(dict(query=query))
+
+
+def fake_sites():
+    en = FakeSite(
+        pages={
+            'Kyiv': dict(title='Kyiv', pageprops=dict(wikibase_item='Q1899')),
+            'Kiev': dict(title='Kiev', redirect=True),
+        },
+        redirects={'Kiev': 'Kyiv'},
+    )
+    uk = FakeSite(pages={'Київ': dict(title='Київ', pageprops=dict(wikibase_item='Q1899'))})
+    wikidata = FakeSite(entities={'Q1899': dict(id='Q1899', sitelinks=dict(ukwiki=dict(title='Київ')))})
+    return dict(d=wikidata, en=en, uk=uk)
+
+
+def test_prefetch(tmp_path):
+    from iw import WikiCache, cache_key
+
+    sites = fake_sites()
+    cache = WikiCache(str(tmp_path / 'cache.sqlite'), sites=sites)
+    cache.prefetch([('en', 'kyiv'), ('en', 'Kiev'), ('en', 'Nowhere'), ('uk', 'Київ')])
+    assert cache_key('en', 'kyiv') == 'en:Kyiv'
+    assert cache.lookup('en:Kyiv').as_dict() == dict(
+        exists=True, redirect=None, wikidata_id='Q1899', uk_version='Київ',
+        redirect_wikidata_id=None, redirect_uk_version=None,
+    )
+    assert cache.lookup('en:Kiev').as_dict() == dict(
+        exists=True, redirect='Kyiv', wikidata_id='Q1899', uk_version='Київ',
+        redirect_wikidata_id='Q1899', redirect_uk_version='Київ',
+    )
+    assert not cache.lookup('en:Nowhere').exists
+    assert cache.lookup('uk:Київ').uk_version == 'Київ'
+    assert len(sites['en'].requests) == 2  # all titles, then redirects
+    assert len(sites['d'].requests) == 1
+
+
+def test_prefetch_same_as_fetch(tmp_path, monkeypatch):
+    import fakewiki
+    world = fakewiki.FakeWorld(fakewiki.synthetic_fixture(100))
+    fakewiki.install(world, monkeypatch.setattr)
+    from iw import WikiCache
+
+    pairs = [(lang, f'Topic {i}') for lang in fakewiki.LANGS for i in range(50)]
+    pairs += [('uk', f'Тема {i}') for i in range(50)]
+    batch = WikiCache(str(tmp_path / 'batch.sqlite'), sites=dict(d=world.repo))
+    batch.prefetch(pairs)
+    single = WikiCache(str(tmp_path / 'single.sqlite'), sites=dict(d=world.repo))
+    for lang, title in pairs:
+        assert batch.lookup(f'{lang}:{title}').as_dict() == single._fetch_page_and_wikidata(lang, title).as_dict()
+
+
+def test_cache_ttl(tmp_path):
+    from datetime import timedelta
+    from iw import WikiCache
+
+    filename = str(tmp_path / 'cache.sqlite')
+    WikiCache(filename, sites=fake_sites()).prefetch([('en', 'Kyiv'), ('en', 'Nowhere')])
+
+    # restarted bot takes fresh results from disk
+    sites = fake_sites()
+    cache = WikiCache(filename, sites=sites, negative_ttl=timedelta(0))
+    assert cache.lookup('en:Kyiv').exists
+    assert cache.lookup('en:Nowhere') is None  # stale
+    cache.revalidate()
+    assert [r['titles'] for r in sites['en'].requests] == [['Nowhere']]
+
+
+def test_cache_eviction(tmp_path):
+    from iw import WikiCache
+
+    cache = WikiCache(str(tmp_path / 'cache.sqlite'), max_entries=2, sites=fake_sites())
+    cache.prefetch([('en', 'Kyiv'), ('en', 'Kiev'), ('en', 'Nowhere')])
+    assert list(cache.cache) == ['en:Kyiv', 'en:Nowhere']  # stored in sorted order
+    cache.lookup('en:Kyiv')
+    cache.lookup('en:Kiev')  # read from disk, evicts en:Nowhere
+    assert list(cache.cache) == ['en:Kyiv', 'en:Kiev']
+    assert cache.stats() == dict(entries=2, hits=1, disk_hits=1, misses=3, evictions=2)
+
+class FakePage:
+    def __init__(self, title, text=None):
+        self._title = title
+        self.text = text or ''
+        self._exists = text is not None
+
+    def title(self):
+        return self._title
+
+    def exists(self):
+        return self._exists
+
+    def toggleTalkPage(self):
+        return None  # has no talk namespace
+
+def test_detect_projects():
+    from iw import detect_projects
+
+    talk = FakePage('Обговорення:Ластівка', '{{Стаття проєкту Птахи}}\n{{Вікіпроєкт:Кінематограф}}')
+    assert list(detect_projects(FakePage('Ластівка'), talk)) == ['bio', 'cinema']
+    assert list(detect_projects(FakePage('Вікіпедія:Проєкт:Фізика/Статті'), FakePage(''))) == ['phys']
+    assert list(detect_projects(FakePage('Ластівка'), None)) == []
+
+def test_scan_templates():
+    from iw import scan_templates, replace_all
+
+    text = '{{Нп|Київ|||Kyiv}} і {{нп|Львів}}\n<gallery>\nФайл:Київ.jpg|{{iw|Дніпро||en|Dnipro}}\n</gallery>'
+    disturb, templates = scan_templates(text)
+    assert not disturb
+    assert [str(t) for t in templates] == ['{{Нп|Київ|||Kyiv}}', '{{нп|Львів}}', '{{iw|Дніпро||en|Dnipro}}']
+
+    disturb, _ = scan_templates('{{редагую}}' + text)
+    assert disturb
+
+    assert replace_all(text, {
+        '{{Нп|Київ|||Kyiv}}': '[[Київ]]',
+        '{{iw|Дніпро||en|Dnipro}}': '[[Дніпро]]',
+    }) == '[[Київ]] і {{нп|Львів}}\n<gallery>\nФайл:Київ.jpg|[[Дніпро]]\n</gallery>'
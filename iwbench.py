@@ -0,0 +1,123 @@
+"""
+Offline benchmark of iw bot.
+
+Runs IwBot.run over backlog of fake wiki (see fakewiki.py), built from
+synthetic or recorded fixture, in a temporary directory, and reports
+pages/s, templates/s, API calls per page and cache hit rate. Runs after
+the first one reuse the cache, like the bot does between sweeps. Results
+are appended to bench_results.jsonl and compared with the previous run on
+the same fixture.
+
+    python3 iwbench.py --pages 5000 --runs 2
+"""
+
+import os
+import time
+import json
+import argparse
+import tempfile
+import contextlib
+from datetime import datetime
+
+import fakewiki
+from templatenames import TemplateNames
+from bench import RESULTS_FILE, git_commit, load_previous
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=5000, help='backlog pages in synthetic fixture')
+    parser.add_argument('--seed', type=int, default=1814)
+    parser.add_argument('--fixture', help='fixture file (default: bench-iw-<pages>.json)')
+    parser.add_argument('--runs', type=int, default=2, help='sweeps of the backlog')
+    parser.add_argument('--results', default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    fixture = args.fixture or f'bench-iw-{args.pages}.json'
+    if not os.path.exists(fixture):
+        print('Building', fixture)
+        fakewiki.save_fixture(fakewiki.synthetic_fixture(args.pages, args.seed), fixture)
+
+    results = run(fakewiki.load_fixture(fixture), args.runs)
+    record = dict(
+        date=datetime.now().isoformat(timespec='seconds'),
+        commit=git_commit(),
+        fixture=fixture,
+        results=results,
+    )
+    previous = load_previous(args.results, fixture)
+    print_results(results, previous)
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def run(fixture, runs=2):
+    """Return {"run N": metrics} of sweeps of the backlog of fixture"""
+    world = fakewiki.FakeWorld(fixture)
+    fakewiki.install(world)
+    os.environ.setdefault('TQDM_DISABLE', '1')  # progress bars of the bot
+    import iw
+    iw.TEMPLATE_NAMES = TemplateNames(world.site('uk'))  # not cached on disk
+
+    templates = sum(
+        len(iw.iw_templates(world.site('uk').pages[title])) for title in world.backlog_titles
+    )
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, 'w') as devnull:
+        os.chdir(workdir)  # for files of bot state and caches
+        try:
+            with contextlib.redirect_stdout(devnull):
+                bot = iw.IwBot(world.backlog)
+            bot.last_problems_update = datetime.now()  # only the sweep is measured
+            for i in range(runs):
+                world.calls.clear()
+                before = bot.wiki_cache.stats()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(devnull):
+                    bot.run()
+                seconds = time.perf_counter() - start
+                results[f'run {i + 1}'] = metrics(
+                    seconds, len(world.backlog_titles), templates, world.calls,
+                    before, bot.wiki_cache.stats(),
+                )
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def metrics(seconds, pages, templates, calls, before, after):
+    hits = after['hits'] - before['hits'] + after['disk_hits'] - before['disk_hits']
+    misses = after['misses'] - before['misses']
+    api_calls = sum(calls.values())
+    return dict(
+        seconds=round(seconds, 3),
+        pages=pages,
+        templates=templates,
+        pages_per_sec=round(pages / seconds, 1),
+        templates_per_sec=round(templates / seconds, 1),
+        api_calls=api_calls,
+        api_calls_per_page=round(api_calls / pages, 3) if pages else None,
+        calls=dict(calls),
+        cache_hit_rate=round(hits / (hits + misses), 3) if hits + misses else None,
+    )
+
+
+def print_results(results, previous=None):
+    print()
+    print(f'{"sweep":<8} {"seconds":>9} {"pages/s":>9} {"templ/s":>9} {"calls/page":>10} {"hit rate":>8}  change')
+    for name, r in results.items():
+        change = ''
+        if previous and name in previous['results']:
+            ratio = r['seconds'] / previous['results'][name]['seconds']
+            change = f'{(ratio - 1) * 100:+.0f}% vs {previous["commit"] or previous["date"]}'
+        hit_rate = f'{r["cache_hit_rate"]:8.1%}' if r['cache_hit_rate'] is not None else f'{"":>8}'
+        print(
+            f'{name:<8} {r["seconds"]:9.3f} {r["pages_per_sec"]:9.0f} {r["templates_per_sec"]:9.0f}'
+            f' {r["api_calls_per_page"]:10.3f} {hit_rate}  {change}'
+        )
+        print(f'{"":<8} calls: ' + ', '.join(f'{k} {v}' for k, v in sorted(r['calls'].items())))
+
+
+if __name__ == '__main__':
+    main()
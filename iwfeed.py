@@ -0,0 +1,235 @@
+"""
+Event driven mode of iw bot.
+
+Instead of sweeping all pages with {{Не перекладено}} again and again,
+follows recent changes of ukwiki and wikidata (or replays recentchange
+events of EventStreams from a file, one JSON per line) and processes only:
+
+- ukwiki pages with iw templates that were edited, as they could change
+  them, and edited pages that got iw templates;
+- pages with iw templates for pages that were just created or moved on
+  ukwiki, or linked on wikidata (found with iwindex).
+
+Full sweep of the backlog becomes a reconciliation job, run every
+RECONCILE_PERIOD.
+
+    python3 iwfeed.py
+    python3 iwfeed.py --replay recentchanges.jsonl
+"""
+
+import re
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import pywikibot
+
+import iw
+import templateindex
+from constants import LANGUAGE_CODES
+
+STATE_FILE = 'iwfeed.json'
+RECONCILE_PERIOD = timedelta(days=7)
+POLL_INTERVAL = 60  # seconds between requests of recent changes
+
+# "/* wbsetsitelink-add:1|enwiki */ Kyiv"
+SITELINK_RE = re.compile(r'/\* wbsetsitelink-(?:add|set)(?:-both)?:\d+\|(\w+) \*/ (.+)')
+# "/* wblinktitles-connect:0| */ [[enwiki:Kyiv]], [[ukwiki:Київ]]"
+LINKTITLES_RE = re.compile(r'\[\[(\w+):([^\]]+)\]\]')
+NOT_WIKIPEDIAS = {'commonswiki', 'metawiki', 'specieswiki', 'wikidatawiki', 'mediawikiwiki', 'sourceswiki'}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replay', help='file with recentchange events, one JSON per line')
+    args = parser.parse_args()
+
+    bot = iw.IwBot(iw.backlinks_backlog)
+    state = None if args.replay else load_state()
+    events = replay(args.replay) if args.replay else recent_changes(state)
+    try:
+        follow(bot, events, state)
+    except KeyboardInterrupt:
+        print('Stopping')
+    print('Waiting for problems update to stop')
+    bot.stop_problems_worker()
+    print('Saving work')
+    bot.save()
+
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return dict(since=pywikibot.Timestamp.utcnow().isoformat(), reconciled=None)
+
+
+def save_state(state):
+    with open(STATE_FILE, 'w') as f:
+        json.dump(state, f)
+
+
+def follow(bot, events, state=None):
+    """Process pages affected by events, in batches
+
+    None in events means there are no new events for now, so pages found
+    so far are processed, state is saved and full sweep is run if it is due.
+    Problems are updated by problems worker of the bot meanwhile.
+    """
+    bot.start_problems_worker()
+    queue = {}  # titles in order they were found
+    edited = {}  # titles of edited pages that had no iw templates
+    for event in events:
+        if event is not None:
+            pages, keys, edits = affected(event, bot.iw_index)
+            bot.wiki_cache.forget(keys)
+            queue.update(dict.fromkeys(pages))
+            edited.update(dict.fromkeys(edits))
+            if len(queue) + len(edited) < bot.batch_size:
+                continue
+        queue.update(dict.fromkeys(with_iw_templates(list(edited))))
+        bot.process_titles(list(queue))
+        queue = {}
+        edited = {}
+        if event is None and state is not None:
+            save_state(state)
+            reconcile(bot, state)
+    queue.update(dict.fromkeys(with_iw_templates(list(edited))))
+    bot.process_titles(list(queue))
+
+
+def reconcile(bot, state):
+    """Run full sweep of the backlog if it was not run for RECONCILE_PERIOD"""
+    if state['reconciled'] and (
+        datetime.now() - datetime.fromisoformat(state['reconciled']) < RECONCILE_PERIOD
+    ):
+        return
+    if not bot.run():
+        raise KeyboardInterrupt
+    state['reconciled'] = datetime.now().isoformat()
+    save_state(state)
+
+
+def affected(event, index):
+    """Return titles of ukwiki pages to process, WikiCache keys to forget, and titles to check
+
+    Edited pages with iw templates (as index knows) are processed, other
+    edited pages are to be checked whether they got iw templates.
+    """
+    pages = set()
+    keys = []
+    edited = set()
+    title = event.get('title', '')
+
+    if event.get('wiki') == 'ukwiki':
+        if event.get('type') in ('edit', 'new') and event.get('namespace') in iw.NAMESPACES:
+            if index.templates(title):
+                pages.add(title)
+            else:
+                edited.add(title)
+        targets = []
+        if event.get('type') == 'new':
+            targets.append(title)
+        if event.get('type') == 'log' and event.get('log_type') in ('move', 'delete'):
+            targets.append(title)
+            targets.append((event.get('log_params') or {}).get('target'))
+        for target in filter(None, targets):
+            keys.append(iw.cache_key('uk', target))
+            pages |= index.pages_for_uk_title(target)
+
+    elif event.get('wiki') == 'wikidatawiki':
+        for site, linked in sitelinks(event.get('comment') or ''):
+            lang = site_language(site)
+            if lang is None:
+                continue
+            keys.append(iw.cache_key(lang, linked))
+            if lang == 'uk':
+                pages |= index.pages_for_uk_title(linked)
+            else:
+                pages |= index.pages_for_target(lang, linked)
+
+    return pages, keys, edited
+
+
+def with_iw_templates(titles):
+    """Yield those of titles of ukwiki pages, which use iw templates now"""
+    if not titles:
+        return
+    spellings = iw.TEMPLATE_NAMES.spellings(iw.IWTMPLS)
+    pages = [pywikibot.Page(iw.SITE, title) for title in titles]
+    for page in iw.SITE.preloadpages(pages, groupsize=iw.PRELOAD_BATCH_SIZE):
+        if templateindex.template_names(page.text) & spellings:
+            yield page.title()
+
+
+def sitelinks(comment):
+    """Yield (site, title) of sitelinks added or changed by wikidata edit with this comment"""
+    m = SITELINK_RE.match(comment)
+    if m:
+        yield m[1], m[2].strip()
+    elif comment.startswith('/* wblinktitles-connect'):
+        for m in LINKTITLES_RE.finditer(comment):
+            yield m[1], m[2]
+
+
+def site_language(site):
+    """Language code of wikipedia by its site id (enwiki, be_x_oldwiki, ...)"""
+    if not site.endswith('wiki') or site in NOT_WIKIPEDIAS:
+        return None
+    lang = site[:-len('wiki')].replace('_', '-')
+    if lang == 'uk' or lang in LANGUAGE_CODES:
+        return lang
+
+
+def replay(filename):
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def recent_changes(state):
+    """Poll recent changes of ukwiki and wikidata forever, yield them as EventStreams events
+
+    Yields None after every poll, with state['since'] moved to its last
+    change. Changes made at that second are listed again by the next poll,
+    so state['seen'] keeps their ids to skip them.
+    """
+    sources = [
+        ('ukwiki', iw.SITE, dict(namespaces=iw.NAMESPACES, changetype='edit|new|log')),
+        ('wikidatawiki', pywikibot.Site('wikidata', 'wikidata'), dict(namespaces=[0], changetype='edit|new')),
+    ]
+    while True:
+        since = state['since']
+        skip = set(state.get('seen', []))  # changes made at since, yielded by previous poll
+        seen = set(skip)  # changes made at latest
+        latest = since
+        for wiki, site, params in sources:
+            for rc in site.recentchanges(start=pywikibot.Timestamp.fromISOformat(since), reverse=True, **params):
+                change = f"{wiki}:{rc['rcid']}"
+                if change in skip:
+                    continue
+                if rc['timestamp'] > latest:
+                    latest = rc['timestamp']
+                    seen = set()
+                if rc['timestamp'] == latest:
+                    seen.add(change)
+                yield dict(
+                    wiki=wiki,
+                    type=rc['type'],
+                    title=rc['title'],
+                    namespace=rc['ns'],
+                    comment=rc.get('comment', ''),
+                    log_type=rc.get('logtype'),
+                    log_params=dict(target=rc.get('logparams', {}).get('target_title')),
+                )
+        state['since'] = latest
+        state['seen'] = sorted(seen)
+        yield None
+        time.sleep(POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+from itertools import islice
+
+import fakewiki
+from iwindex import IwIndex
+from templatenames import TemplateNames
+
+# iwfeed imports iw, which connects to wiki on import, so it is imported after fakewiki.install
+
+def test_sitelinks(monkeypatch):
+    fakewiki.install(fakewiki.FakeWorld({}), monkeypatch.setattr)
+    from iwfeed import sitelinks, site_language
+    assert list(sitelinks('/* wbsetsitelink-add:1|enwiki */ Kyiv')) == [('enwiki', 'Kyiv')]
+    assert list(sitelinks('/* wblinktitles-connect:0| */ [[enwiki:Kyiv]], [[ukwiki:Київ]]')) == [
+        ('enwiki', 'Kyiv'), ('ukwiki', 'Київ'),
+    ]
+    assert list(sitelinks('/* wbsetlabel-add:1|en */ Kyiv')) == []
+    assert site_language('be_x_oldwiki') == 'be-x-old'
+    assert site_language('commonswiki') is None
+
+def test_affected(tmp_path, monkeypatch):
+    fakewiki.install(fakewiki.FakeWorld({}), monkeypatch.setattr)
+    from iwfeed import affected
+    index = IwIndex(str(tmp_path / 'iwindex.sqlite'))
+    index.set_page('Київ', [('Лавра', 'en', 'Lavra', True)])
+
+    assert affected(dict(wiki='ukwiki', type='new', title='Лавра', namespace=0), index) == (
+        {'Київ'}, ['uk:Лавра'], {'Лавра'},
+    )
+    assert affected(dict(wiki='ukwiki', type='edit', title='Київ', namespace=0), index) == (
+        {'Київ'}, [], set(),
+    )
+    assert affected(dict(
+        wiki='ukwiki', type='log', log_type='move', title='Лавра (значення)', namespace=0,
+        log_params=dict(target='Лавра'),
+    ), index) == ({'Київ'}, ['uk:Лавра (значення)', 'uk:Лавра'], set())
+    assert affected(dict(
+        wiki='wikidatawiki', type='edit', title='Q1', comment='/* wbsetsitelink-add:1|enwiki */ Lavra',
+    ), index) == ({'Київ'}, ['en:Lavra'], set())
+    assert affected(dict(wiki='ukwiki', type='edit', title='Користувач:Хтось', namespace=2), index) == (set(), [], set())
+
+def test_with_iw_templates(monkeypatch):
+    world = fakewiki.FakeWorld(dict(sites=dict(uk=dict(pages={
+        'Київ': 'Текст {{нп|Лавра||en|Lavra}}',
+        'Дніпро': 'Текст {{Не перекладено|Лавра}}',
+        'Львів': 'Текст {{Cite web|title=Нп}}',
+    }))))
+    fakewiki.install(world, monkeypatch.setattr)
+    import iw
+    from iwfeed import with_iw_templates
+    monkeypatch.setattr(iw, 'SITE', world.site('uk'))
+    monkeypatch.setattr(iw, 'TEMPLATE_NAMES', TemplateNames())
+    assert list(with_iw_templates(['Київ', 'Дніпро', 'Львів', 'Харків'])) == ['Київ', 'Дніпро']
+    assert world.calls['preload'] == 1
+
+def test_follow(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    world = fakewiki.FakeWorld(dict(sites=dict(
+        uk=dict(pages={'Стаття': '{{нп|Київ||en|Kyiv}}', 'Київ': ''}, items={'Київ': 'Q1899'}),
+        en=dict(pages={'Kyiv': ''}, items={'Kyiv': 'Q1899'}),
+    ), sitelinks={'Q1899': 'Київ'}))
+    fakewiki.install(world, monkeypatch.setattr)
+    import iw
+    from iwfeed import follow
+    monkeypatch.setattr(iw, 'TEMPLATE_NAMES', TemplateNames())
+
+    bot = iw.IwBot(world.backlog)
+    follow(bot, [dict(wiki='ukwiki', type='edit', title='Стаття', namespace=0)])
+    assert world.site('uk').pages['Стаття'] == '[[Київ]]'
+    assert bot.problems_worker.is_alive()  # problems are updated next to the feed
+    bot.stop_problems_worker()
+    assert not bot.problems_worker.is_alive()
+
+def test_recent_changes(monkeypatch):
+    world = fakewiki.FakeWorld({})
+    fakewiki.install(world, monkeypatch.setattr)
+    import iwfeed
+    monkeypatch.setattr(iwfeed.time, 'sleep', lambda seconds: None)
+    changes = [
+        dict(rcid=1, type='edit', title='Київ', ns=0, timestamp='2024-01-01T00:00:00Z'),
+        dict(rcid=2, type='new', title='Лавра', ns=0, timestamp='2024-01-01T00:00:05Z'),
+    ]
+    monkeypatch.setattr(world.site('uk'), 'recentchanges', lambda start, **kwargs: [
+        rc for rc in changes if rc['timestamp'] >= start.isoformat()
+    ])
+
+    state = dict(since='2024-01-01T00:00:00Z')
+    events = iwfeed.recent_changes(state)
+    assert [e and e['title'] for e in islice(events, 3)] == ['Київ', 'Лавра', None]
+    assert state == dict(since='2024-01-01T00:00:05Z', seen=['ukwiki:2'])
+    changes.append(dict(rcid=3, type='edit', title='Київ', ns=0, timestamp='2024-01-01T00:00:05Z'))
+    assert [e and e['title'] for e in islice(events, 2)] == ['Київ', None]  # not Лавра again
+    assert state == dict(since='2024-01-01T00:00:05Z', seen=['ukwiki:2', 'ukwiki:3'])
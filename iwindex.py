@@ -0,0 +1,124 @@
+"""
+Index of iw templates ({{Не перекладено}}) left on pages.
+
+For every page processed by iw bot keeps its templates: which ukwiki title
+they want, which page in other language they point to, and whether that
+page exists, so it is wanted to be translated. Lookups go both ways: from
+page to its templates, and from ukwiki title or foreign page to the pages
+that want them. So when some page gets created, moved or linked on
+wikidata, we know which pages to recheck, and the most wanted translations
+could be listed at any time.
+
+    index = IwIndex()
+    index.set_page('Київ', [('Лавра', 'en', 'Lavra', True)])
+    index.pages_for_target('en', 'Lavra')
+    index.pages_for_uk_title('Лавра')
+    index.top(500)
+
+Titles are kept as MediaWiki stores them (see canonical_title), so
+lookups with titles from recent changes find templates written with
+underscores or lowercase first letter.
+"""
+
+import sqlite3
+import threading
+
+INDEX_FILE = 'iwindex.sqlite'
+
+
+def canonical_title(title):
+    """Title as MediaWiki stores it: spaces for underscores, first letter capitalized
+
+    Case of the first letter is insensitive on all wikipedias and wikidata.
+    """
+    title = ' '.join(title.replace('_', ' ').split())
+    return title[:1].upper() + title[1:]
+
+
+class IwIndex:
+    """Could be used from several threads"""
+
+    def __init__(self, filename=INDEX_FILE):
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS templates (
+                page TEXT NOT NULL,
+                uk_title TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                title TEXT NOT NULL,
+                wanted INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(templates)')]
+        if 'wanted' not in columns:  # index built before wanted pages were tracked
+            self.db.execute('ALTER TABLE templates ADD COLUMN wanted INTEGER NOT NULL DEFAULT 0')
+        self.db.execute('CREATE INDEX IF NOT EXISTS templates_by_page ON templates (page)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS templates_by_target ON templates (lang, title)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS templates_by_uk_title ON templates (uk_title)')
+
+    def set_page(self, page, templates):
+        """Replace templates of page with (uk_title, lang, title, wanted) tuples"""
+        page = canonical_title(page)
+        templates = {
+            (canonical_title(uk_title), lang, canonical_title(title), wanted)
+            for uk_title, lang, title, wanted in templates
+        }
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM templates WHERE page = ?', (page, ))
+            self.db.executemany(
+                'INSERT INTO templates VALUES (?, ?, ?, ?, ?)',
+                ((page, uk_title, lang, title, wanted) for uk_title, lang, title, wanted in templates),
+            )
+
+    def templates(self, page):
+        """Return (uk_title, lang, title, wanted) of templates on page"""
+        with self.lock:
+            return [
+                (uk_title, lang, title, bool(wanted))
+                for uk_title, lang, title, wanted in self.db.execute(
+                    'SELECT uk_title, lang, title, wanted FROM templates WHERE page = ?',
+                    (canonical_title(page), )
+                )
+            ]
+
+    def pages_for_target(self, lang, title):
+        """Pages with iw templates pointing to the page in other language"""
+        with self.lock:
+            return {page for page, in self.db.execute(
+                'SELECT DISTINCT page FROM templates WHERE lang = ? AND title = ?',
+                (lang, canonical_title(title)),
+            )}
+
+    def pages_for_uk_title(self, uk_title):
+        """Pages with iw templates that want ukwiki page with this title"""
+        with self.lock:
+            return {page for page, in self.db.execute(
+                'SELECT DISTINCT page FROM templates WHERE uk_title = ?', (canonical_title(uk_title), )
+            )}
+
+    def top(self, n):
+        """Return (lang, title, number of pages) of n most wanted translations"""
+        with self.lock:
+            return self.db.execute('''
+                SELECT lang, title, count(DISTINCT page) AS pages FROM templates
+                WHERE wanted
+                GROUP BY lang, title
+                ORDER BY pages DESC, lang || ':' || title
+                LIMIT ?
+            ''', (n, )).fetchall()
+
+    def wanted_count(self):
+        """Number of different pages wanted to be translated"""
+        with self.lock:
+            return self.db.execute(
+                'SELECT count(*) FROM (SELECT DISTINCT lang, title FROM templates WHERE wanted)'
+            ).fetchone()[0]
+
+    def keep_only(self, pages):
+        """Delete templates of pages not in pages, i.e. ones without iw templates anymore"""
+        with self.lock, self.db:
+            self.db.execute('CREATE TEMP TABLE IF NOT EXISTS keep (page TEXT PRIMARY KEY)')
+            self.db.execute('DELETE FROM keep')
+            self.db.executemany('INSERT OR IGNORE INTO keep VALUES (?)', ((canonical_title(p), ) for p in pages))
+            self.db.execute('DELETE FROM templates WHERE page NOT IN (SELECT page FROM keep)')
@@ -0,0 +1,31 @@
+from iwindex import IwIndex
+
+def test_iw_index(tmp_path):
+    index = IwIndex(str(tmp_path / 'iwindex.sqlite'))
+    index.set_page('Київ', [('Лавра', 'en', 'Lavra', True), ('Дніпро', 'en', 'Dnipro', True)])
+    index.set_page('Дніпро', [('Лавра', 'de', 'Lavra', False)])
+    assert index.pages_for_uk_title('Лавра') == {'Київ', 'Дніпро'}
+    assert index.pages_for_target('en', 'Lavra') == {'Київ'}
+    assert index.templates('Дніпро') == [('Лавра', 'de', 'Lavra', False)]
+
+    index.set_page('Київ', [('Дніпро', 'en', 'Dnipro', True)])  # Лавра was replaced with link
+    assert index.pages_for_uk_title('Лавра') == {'Дніпро'}
+    assert index.pages_for_target('en', 'Dnipro') == {'Київ'}
+
+def test_top(tmp_path):
+    index = IwIndex(str(tmp_path / 'iwindex.sqlite'))
+    index.set_page('А', [('Б', 'en', 'B', True), ('В', 'en', 'C', True), ('Г', 'fr', 'D', False)])
+    index.set_page('Б', [('В', 'en', 'C', True), ('Г', 'fr', 'D', False)])
+    index.set_page('В', [('Б', 'en', 'B', True), ('Д', 'de', 'E', True)])
+    assert index.top(2) == [('en', 'B', 2), ('en', 'C', 2)]
+    assert index.wanted_count() == 3
+
+    index.keep_only(['А'])
+    assert index.top(5) == [('en', 'B', 1), ('en', 'C', 1)]
+
+def test_canonical_titles(tmp_path):
+    index = IwIndex(str(tmp_path / 'iwindex.sqlite'))
+    index.set_page('Київ', [('києво-Печерська_лавра', 'en', 'kyiv_Pechersk  Lavra', True)])
+    assert index.pages_for_uk_title('Києво-Печерська лавра') == {'Київ'}
+    assert index.pages_for_target('en', 'Kyiv Pechersk Lavra') == {'Київ'}
+    assert index.templates('київ') == [('Києво-Печерська лавра', 'en', 'Kyiv Pechersk Lavra', True)]
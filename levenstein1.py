@@ -1,24 +1,20 @@
 import re
 import sys
-import json
-from collections import defaultdict, Counter
+from collections import defaultdict
 from itertools import permutations
 from urllib.parse import urlparse
  
 import mwparserfromhell
 from pywikibot.xmlreader import XmlDump
+
+from pageindex import PageIndex
+from linkcount import Counts
  
 def main():
-    with open('pages.lst') as f:
-        existing_pages = set(
-            p.strip() for p in f
-        )
-    with open('top_links.json') as f:
-        top_links = Counter(json.load(f))
+    existing_pages = PageIndex()
+    top_links = Counts()
 
-    for i, (link, frequency) in enumerate(top_links.most_common()):
-        if frequency < 2:
-            break
+    for i, (link, frequency) in enumerate(top_links.most_common(min_count=2)):
         if link in existing_pages:
             continue
         print(f'\r{i} {frequency} {link}', end='', file=sys.stderr)
@@ -0,0 +1,137 @@
+"""
+Counting of links in bounded memory.
+
+SpillCounter keeps at most max_keys counts in memory, spilling sorted
+partial counts to temporary shard files when it grows larger. Shards are
+merged at the end into SQLite table, sorted by count, so consumers stream
+most_common() without loading it all.
+
+    counter = SpillCounter()
+    for links in iter_links(dump):
+        counter.update(links)
+    counts = counter.save('top_links.sqlite')
+    for link, frequency in counts.most_common():
+        ...
+"""
+
+import os
+import json
+import heapq
+import sqlite3
+import tempfile
+from collections import Counter
+from itertools import groupby
+
+COUNTS_FILE = 'top_links.sqlite'
+MAX_KEYS = 2_000_000
+
+
+class SpillCounter:
+    def __init__(self, max_keys=MAX_KEYS, tmpdir=None):
+        self.max_keys = max_keys
+        self.tmpdir = tmpdir
+        self.counter = Counter()
+        self.shards = []
+
+    def update(self, keys):
+        self.counter.update(keys)
+        if len(self.counter) >= self.max_keys:
+            self.spill()
+
+    def spill(self):
+        """Write counts in memory to a sorted shard file"""
+        if not self.counter:
+            return
+        fd, filename = tempfile.mkstemp(suffix='.shard', dir=self.tmpdir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            write_shard(f, sorted(self.counter.items()))
+        self.shards.append(filename)
+        self.counter = Counter()
+
+    def items(self):
+        """Iterate over (key, count) of all shards, sorted by key"""
+        self.spill()
+        files = [open(filename, encoding='utf-8') for filename in self.shards]
+        try:
+            yield from merge_counts(*map(read_shard, files))
+        finally:
+            for f in files:
+                f.close()
+
+    def save(self, filename=COUNTS_FILE):
+        """Write merged counts to SQLite file, remove shards"""
+        try:
+            return write_counts(filename, self.items())
+        finally:
+            self.close()
+
+    def close(self):
+        for filename in self.shards:
+            os.remove(filename)
+        self.shards = []
+        self.counter = Counter()
+
+
+def write_shard(f, items):
+    for item in items:
+        f.write(json.dumps(item, ensure_ascii=False))
+        f.write('\n')
+
+
+def read_shard(f):
+    for line in f:
+        key, count = json.loads(line)
+        yield key, count
+
+
+def merge_counts(*sorted_counts):
+    """Merge iterators of (key, count) sorted by key, summing counts"""
+    merged = heapq.merge(*sorted_counts, key=lambda item: item[0])
+    for key, group in groupby(merged, key=lambda item: item[0]):
+        yield key, sum(count for _, count in group)
+
+
+def write_counts(filename, items):
+    tmp_filename = filename + '.tmp'
+    if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+    db = sqlite3.connect(tmp_filename)
+    db.execute('CREATE TABLE counts (key TEXT PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID')
+    db.executemany('INSERT INTO counts VALUES (?, ?)', items)
+    db.execute('CREATE INDEX counts_by_count ON counts (count DESC, key)')
+    db.commit()
+    db.close()
+    os.replace(tmp_filename, filename)
+    return Counts(filename)
+
+
+class Counts:
+    """Read-only access to counts saved by SpillCounter"""
+
+    def __init__(self, filename=COUNTS_FILE):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(filename)
+        self.db = sqlite3.connect(f'file:{filename}?mode=ro', uri=True)
+
+    def most_common(self, n=None, min_count=None):
+        """Iterate over (key, count) from the most common, like Counter.most_common"""
+        query = 'SELECT key, count FROM counts'
+        params = []
+        if min_count is not None:
+            query += ' WHERE count >= ?'
+            params.append(min_count)
+        query += ' ORDER BY count DESC, key'
+        if n is not None:
+            query += ' LIMIT ?'
+            params.append(n)
+        yield from self.db.execute(query, params)
+
+    def __getitem__(self, key):
+        row = self.db.execute('SELECT count FROM counts WHERE key = ?', (key, )).fetchone()
+        return row[0] if row else 0
+
+    def total(self):
+        return self.db.execute('SELECT coalesce(sum(count), 0) FROM counts').fetchone()[0]
+
+    def __len__(self):
+        return self.db.execute('SELECT count(*) FROM counts').fetchone()[0]
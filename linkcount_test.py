@@ -0,0 +1,27 @@
+from collections import Counter
+
+from linkcount import SpillCounter, merge_counts
+
+def test_spill_counter(tmp_path):
+    pages = [['Київ', 'Львів'], ['Київ'], ['Одеса', 'Київ', 'Львів'], ['Харків']] * 5
+    counter = SpillCounter(max_keys=2, tmpdir=str(tmp_path))
+    for links in pages:
+        counter.update(links)
+    assert len(counter.shards) > 1
+
+    counts = counter.save(str(tmp_path / 'counts.sqlite'))
+    assert list(tmp_path.glob('*.shard')) == []
+
+    expected = Counter(link for links in pages for link in links)
+    assert list(counts.most_common()) == sorted(expected.items(), key=lambda i: (-i[1], i[0]))
+    assert list(counts.most_common(min_count=10)) == [('Київ', 15), ('Львів', 10)]
+    assert list(counts.most_common(1)) == [('Київ', 15)]
+    assert counts['Одеса'] == 5
+    assert counts['Дніпро'] == 0
+    assert counts.total() == 35
+    assert len(counts) == 4
+
+def test_merge_counts():
+    assert list(merge_counts([('a', 1), ('c', 2)], [('a', 3), ('b', 1)])) == [
+        ('a', 4), ('b', 1), ('c', 2),
+    ]
@@ -1,80 +1,84 @@
 import re
 import sys
-import json
-from collections import defaultdict, Counter
+import argparse
+from collections import defaultdict
 from urllib.parse import urlparse
- 
-import mwparserfromhell
-from pywikibot.xmlreader import XmlDump
+
+import dumpscan
+import pageindex
+import pagestore
+import linkcount
+import wikitext
  
 def main():
-    filename = sys.argv[1]
-    existing_pages = get_pages(filename)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dump')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--store', help='keep links of pages in this file, and recount only changed pages')
+    parser.add_argument('--partial', action='store_true', help='dump has only changed pages (adds-changes dump)')
+    args = parser.parse_args()
+
+    existing_pages = get_pages(args.dump, workers=args.workers)
     print(f'''
     Have:
-        - {len(existing_pages)} pages
+        - {existing_pages.count(ns=0)} pages
     ''')
 
-    count_links(get_filename())
+    count_links(args.dump, workers=args.workers, store=args.store, partial=args.partial)
  
-def count_links(filename):
-    links_count = Counter(iter_links(filename))
-    top = links_count.most_common(1)[0]
+def count_links(filename, workers=1, store=None, partial=False):
+    if store:
+        pages_links = iter_stored_links(filename, store, partial, workers)
+    else:
+        pages_links = dumpscan.scan(filename, page_links, workers=workers, namespaces={'0'})
+    counter = linkcount.SpillCounter()
+    for links in pages_links:
+        counter.update(links)
+    links_count = counter.save(linkcount.COUNTS_FILE)
+
+    top = next(links_count.most_common(1))
     print(f'''
-        - {sum(links_count.values())} total links
+        - {links_count.total()} total links
         - {len(links_count)} different links
         - top link, [[{top[0]}]] is linked to {top[1]} times
     ''')
-    with open('top_links.json', 'w') as f:
-        json.dump(links_count, f, ensure_ascii=False, indent='')
 
-def iter_links(dump_filename):
-    i = 0
-    for page in XmlDump(dump_filename).parse():
-        if page.ns != '0':
-            continue
-        i += 1
-        if i % 123 == 0:
-            print('\033[K\r', i, page.title, file=sys.stderr, end='')
+def iter_links(dump_filename, workers=1):
+    for links in dumpscan.scan(dump_filename, page_links, workers=workers, namespaces={'0'}):
+        yield from links
 
-        for link in get_links(page):
-            l = link.replace('‎', '')
-            l = re.sub(' +', ' ', l)
-            if len(link) < 3:
-                continue
-            yield l[0].upper() + l[1:]
+def iter_stored_links(dump_filename, store_filename, partial=False, workers=1):
+    """Update links of changed pages in store, yield links of every page"""
+    store = pagestore.update(
+        store_filename, dump_filename, dict(links=page_links),
+        partial=partial, workers=workers, namespaces={'0'},
+    )
+    yield from store.values('links')
 
-def get_pages(dump_filename):
+def page_links(page):
+    if page.ns != '0':
+        return
+    links = []
+    for link in get_links(page):
+        l = link.replace('‎', '')
+        l = re.sub(' +', ' ', l)
+        if len(link) < 3:
+            continue
+        links.append(l[0].upper() + l[1:])
+    return links
+
+def get_pages(dump_filename, workers=1):
     try:
-        with open('pages.lst') as f:
-            existing_pages = set(
-                p.strip() for p in f
-            )
-        if existing_pages:
-            return existing_pages
+        return pageindex.PageIndex()
     except FileNotFoundError:
         pass
 
     print('gathering list of pages')
-    existing_pages = set()
-    i = 0
-    for page in XmlDump(dump_filename).parse():
-        if page.ns != '0':
-            continue
-        existing_pages.add(page.title)
-        i+=1
-        if i % 123 == 1:
-            print('\033[K\r', i, page.title, end='')
-
-    with open('pages.lst', 'w') as f:
-        f.write('\n'.join(existing_pages))
-
-    return existing_pages
+    return pageindex.build(dump_filename, workers=workers)
 
 def get_links(page):
-    content = mwparserfromhell.parse(page.text)
-    for link in content.filter_wikilinks():
-        r = str(link.title).strip()
+    for title in wikitext.wikilinks(page.text):
+        r = title.strip()
         if ':' in r: # skip non-default namespaces
             continue
         r = r.split('#', 1)[0] # get rid of everything after '#'
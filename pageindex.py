@@ -0,0 +1,132 @@
+"""
+On-disk index of all pages from the dump.
+
+Keeps title, namespace, page id, redirect target, length in bytes and
+text hash of every page in SQLite table clustered by title, so lookups are
+binary searches in a memory mapped file and nothing is loaded into RAM.
+
+    python3 pageindex.py ukwiki-pages-articles.xml.bz2 --workers 8
+
+    pages = PageIndex()
+    'Київ' in pages
+    pages.redirect_target('Киев')
+"""
+
+import os
+import sqlite3
+import argparse
+from collections import namedtuple
+
+import dumpscan
+
+INDEX_FILE = 'pages.sqlite'
+MMAP_SIZE = 1 << 32
+
+PageInfo = namedtuple('PageInfo', 'title ns id redirect length sha1')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dump')
+    parser.add_argument('--index', default=INDEX_FILE)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    index = build(args.dump, args.index, workers=args.workers)
+    print(f'Indexed {len(index)} pages')
+
+
+def build(dump_filename, filename=INDEX_FILE, workers=1):
+    """Build index from the dump, replacing existing one"""
+    tmp_filename = filename + '.tmp'
+    if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+    db = sqlite3.connect(tmp_filename)
+    db.execute('''
+        CREATE TABLE pages (
+            title TEXT PRIMARY KEY,
+            ns INTEGER NOT NULL,
+            id INTEGER NOT NULL,
+            redirect TEXT,
+            length INTEGER,
+            sha1 TEXT
+        ) WITHOUT ROWID
+    ''')
+    rows = dumpscan.scan(dump_filename, page_info, workers=workers)
+    for batch in dumpscan.batched(rows, 10000):
+        db.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)', batch)
+    db.commit()
+    db.close()
+    os.replace(tmp_filename, filename)
+    return PageIndex(filename)
+
+
+def page_info(page):
+    return PageInfo(
+        title=page.title,
+        ns=int(page.ns),
+        id=int(page.id),
+        redirect=page.redirect,
+        length=page.size,
+        sha1=page.sha1,
+    )
+
+
+class PageIndex:
+    """Read-only access to page index"""
+
+    def __init__(self, filename=INDEX_FILE):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(filename)
+        self.db = sqlite3.connect(f'file:{filename}?mode=ro', uri=True)
+        self.db.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+
+    def get(self, title):
+        """Return PageInfo for title or None if there is no such page"""
+        row = self.db.execute('SELECT * FROM pages WHERE title = ?', (title, )).fetchone()
+        if row:
+            return PageInfo(*row)
+
+    def __contains__(self, title):
+        return self.db.execute(
+            'SELECT 1 FROM pages WHERE title = ?', (title, )
+        ).fetchone() is not None
+
+    def redirect_target(self, title):
+        """Return where page redirects to, None if it is not a redirect"""
+        row = self.db.execute('SELECT redirect FROM pages WHERE title = ?', (title, )).fetchone()
+        if row:
+            return row[0]
+
+    def resolve(self, title):
+        """Follow redirects, return final title or None if page does not exist"""
+        seen = set()
+        while title not in seen:
+            seen.add(title)
+            info = self.get(title)
+            if info is None:
+                return None
+            if info.redirect is None:
+                return title
+            title = info.redirect
+        return None  # redirect loop
+
+    def titles(self, ns=0, redirects=True):
+        """Iterate over sorted titles in namespace"""
+        query = 'SELECT title FROM pages WHERE ns = ?'
+        if not redirects:
+            query += ' AND redirect IS NULL'
+        for title, in self.db.execute(query + ' ORDER BY title', (ns, )):
+            yield title
+
+    def count(self, ns=None):
+        if ns is None:
+            return len(self)
+        return self.db.execute('SELECT count(*) FROM pages WHERE ns = ?', (ns, )).fetchone()[0]
+
+    def __len__(self):
+        return self.db.execute('SELECT count(*) FROM pages').fetchone()[0]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+from pageindex import build
+
+from dumpscan_test import write_dump
+
+def test_page_index(tmp_path):
+    index = build(write_dump(tmp_path), str(tmp_path / 'pages.sqlite'), workers=2)
+
+    assert len(index) == 250
+    assert index.count(ns=0) == 167
+    assert 'Сторінка 1' in index
+    assert 'Сторінка 251' not in index
+    assert index.redirect_target('Сторінка 7') == 'Київ'
+    assert index.redirect_target('Сторінка 8') is None
+    assert index.resolve('Сторінка 7') is None  # Київ is not in the dump
+    assert index.resolve('Сторінка 8') == 'Сторінка 8'
+
+    info = index.get('Обговорення:Сторінка 3')
+    assert (info.ns, info.id, info.length) == (1, 3, 10)
+
+    titles = list(index.titles(ns=0))
+    assert titles == sorted(titles)
+    assert len(titles) == 167
@@ -0,0 +1,126 @@
+"""
+Store of per-page results of dump processing, for incremental runs.
+
+Results of every kind (links of page, report rows, ...) are kept by page id
+together with revision id they were computed for. Updating store from a
+newer full dump, or from adds-changes dump with only changed pages,
+recomputes results only for pages with newer revisions.
+
+    update('pagestore.sqlite', 'ukwiki-20240102-pages-meta-hist-incr.xml.bz2',
+           dict(links=page_links), partial=True)
+    for links in PageStore().values('links'):
+        ...
+"""
+
+import json
+import sqlite3
+
+import dumpscan
+
+STORE_FILE = 'pagestore.sqlite'
+
+
+class PageStore:
+    def __init__(self, filename=STORE_FILE):
+        self.filename = filename
+        self.db = sqlite3.connect(filename, timeout=60)
+        self.db.execute('PRAGMA journal_mode = WAL')  # workers read while main process writes
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                page_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                revision INTEGER NOT NULL,
+                value TEXT,
+                PRIMARY KEY (page_id, kind)
+            ) WITHOUT ROWID
+        ''')
+
+    def revisions(self, page_id):
+        """Return {kind: revision} of results stored for page"""
+        return dict(self.db.execute(
+            'SELECT kind, revision FROM results WHERE page_id = ?', (page_id, )
+        ))
+
+    def put(self, rows):
+        """Store (page_id, kind, revision, value) rows"""
+        self.db.executemany(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+            ((page_id, kind, revision, json.dumps(value, ensure_ascii=False))
+             for page_id, kind, revision, value in rows),
+        )
+        self.db.commit()
+
+    def values(self, kind):
+        """Iterate over stored results of kind, skipping empty ones"""
+        for value, in self.db.execute(
+            "SELECT value FROM results WHERE kind = ? AND value != 'null'", (kind, )
+        ):
+            yield json.loads(value)
+
+    def keep_only(self, kinds, page_ids):
+        """Delete results of kinds for pages not in page_ids, i.e. deleted from wiki"""
+        self.db.execute('CREATE TEMP TABLE IF NOT EXISTS seen (page_id INTEGER PRIMARY KEY)')
+        self.db.execute('DELETE FROM seen')
+        for batch in dumpscan.batched(page_ids, 10000):
+            self.db.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((i, ) for i in batch))
+        for kind in kinds:
+            self.db.execute(
+                'DELETE FROM results WHERE kind = ? AND page_id NOT IN (SELECT page_id FROM seen)',
+                (kind, ),
+            )
+        self.db.commit()
+
+
+class StoreUpdater:
+    """Compute results of pages changed since they were stored.
+
+    Works in dumpscan workers, every worker opens store for itself.
+    """
+
+    def __init__(self, funcs, filename, wrap=None):
+        self.funcs = funcs
+        self.filename = filename
+        self.wrap = wrap
+        self.store = None
+
+    def __getstate__(self):
+        return dict(self.__dict__, store=None)
+
+    def __call__(self, page):
+        if self.store is None:
+            self.store = PageStore(self.filename)
+        page_id = int(page.id)
+        revision = int(page.revisionid)
+        stored = self.store.revisions(page_id)
+        if self.wrap is not None:
+            page = self.wrap(page)
+        rows = [
+            (page_id, kind, revision, func(page))
+            for kind, func in self.funcs.items()
+            if stored.get(kind, -1) < revision
+        ]
+        return page_id, rows
+
+
+def update(filename, dump_filename, funcs, partial=False, workers=1, namespaces=None, wrap=None):
+    """Update results of every kind in funcs ({kind: func(page)}) from the dump
+
+    When dump is partial (adds-changes dump), pages missing in it are kept,
+    otherwise they are considered deleted.
+    wrap(page), if given, is applied to the page before passing it to funcs.
+    """
+    store = PageStore(filename)
+    updater = StoreUpdater(funcs, filename, wrap)
+    seen = []
+    changed = 0
+    results = dumpscan.scan(dump_filename, updater, workers=workers, namespaces=namespaces)
+    for batch in dumpscan.batched(results, 1000):
+        rows = [row for page_id, page_rows in batch for row in page_rows]
+        changed += len(rows)
+        store.put(rows)
+        if not partial:
+            seen.extend(page_id for page_id, _ in batch)
+    if not partial:
+        store.keep_only(funcs, seen)
+    print(f'Updated {changed} results')
+    return store
@@ -0,0 +1,33 @@
+import bz2
+
+from pagestore import update
+
+from dumpscan_test import HEADER, FOOTER, page_xml
+
+def write(filename, pages):
+    content = HEADER + ''.join(pages) + FOOTER
+    filename.write_bytes(bz2.compress(content.encode('utf-8')))
+    return str(filename)
+
+def text(page):
+    return page.text
+
+def test_update(tmp_path):
+    store_filename = str(tmp_path / 'pagestore.sqlite')
+    dump = write(tmp_path / 'dump.xml.bz2', [page_xml(i) for i in range(1, 11)])
+    store = update(store_filename, dump, dict(text=text))
+    assert len(list(store.values('text'))) == 10
+
+    changed = page_xml(3).replace('<id>1003</id>', '<id>2003</id>').replace('Текст', 'Новий текст')
+    dump = write(tmp_path / 'incr.xml.bz2', [changed])
+    store = update(store_filename, dump, dict(text=text), partial=True)
+    values = list(store.values('text'))
+    assert len(values) == 10
+    assert values[2].startswith('Новий текст')
+
+    # older revision does not overwrite newer one
+    dump = write(tmp_path / 'dump.xml.bz2', [page_xml(i) for i in range(1, 6)])
+    store = update(store_filename, dump, dict(text=text))
+    values = list(store.values('text'))
+    assert len(values) == 5  # others are deleted
+    assert values[2].startswith('Новий текст')
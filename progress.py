@@ -0,0 +1,129 @@
+"""
+Progress and throughput telemetry of long-running scans.
+
+Shows pages/s, compressed input consumed per second, ETA from offset in
+the input file and peak RSS on one status line in terminal, or as a full
+line every interval seconds when stderr is a log file. With log (or
+PROGRESS_LOG environment variable) also appends the same metrics as JSON
+lines to it, for monitoring.
+
+    progress = Progress(os.path.getsize(dump), label='links')
+    for count, offset in ...:
+        progress.update(count, offset=offset)
+    progress.close()
+"""
+
+import os
+import sys
+import json
+import time
+
+try:
+    import resource
+except ImportError:  # not on Unix
+    resource = None
+
+LOG_ENV = 'PROGRESS_LOG'
+TERMINAL_INTERVAL = 0.5  # seconds between status line updates
+INTERVAL = 30  # seconds between lines in log files
+
+
+class Progress:
+    def __init__(self, total_bytes=None, label='', log=None, interval=INTERVAL, out=sys.stderr):
+        self.total_bytes = total_bytes
+        self.label = label
+        self.log = log or os.environ.get(LOG_ENV)
+        self.interval = interval
+        self.out = out
+        self.tty = out.isatty()
+        self.pages = 0
+        self.offset = 0  # bytes of compressed input consumed
+        self.start = time.monotonic()
+        self.last_shown = self.start
+        self.last_logged = self.start
+
+    def update(self, pages, offset=None, consumed=0):
+        """Count pages done and input consumed, absolute offset or increment"""
+        self.pages += pages
+        if offset is not None:
+            self.offset = offset
+        self.offset += consumed
+        now = time.monotonic()
+        if now - self.last_shown >= (TERMINAL_INTERVAL if self.tty else self.interval):
+            self.last_shown = now
+            self.show()
+        if self.log and now - self.last_logged >= self.interval:
+            self.last_logged = now
+            self.write_log()
+
+    def metrics(self, done=False):
+        elapsed = time.monotonic() - self.start
+        m = dict(
+            time=round(time.time(), 3),
+            label=self.label,
+            pages=self.pages,
+            offset=self.offset,
+            total_bytes=self.total_bytes,
+            elapsed=round(elapsed, 3),
+            pages_per_sec=round(self.pages / elapsed, 1) if elapsed else None,
+            bytes_per_sec=round(self.offset / elapsed) if elapsed else None,
+            eta=None,
+            peak_rss=peak_rss(),
+            done=done,
+        )
+        if done:
+            m['eta'] = 0
+        elif self.total_bytes and self.offset:
+            m['eta'] = round(elapsed * (self.total_bytes - self.offset) / self.offset, 1)
+        return m
+
+    def show(self, done=False):
+        m = self.metrics(done)
+        parts = [f'{m["pages"]} pages']
+        if m['pages_per_sec'] is not None:
+            parts.append(f'{m["pages_per_sec"]:.0f} pages/s')
+        if m['bytes_per_sec']:
+            parts.append(f'{m["bytes_per_sec"] / 1e6:.2f} MB/s')
+        if self.total_bytes and self.offset:
+            parts.append(f'{100 * self.offset / self.total_bytes:.1f}%')
+        if m['eta']:
+            parts.append(f'ETA {format_duration(m["eta"])}')
+        if m['peak_rss']:
+            parts.append(f'peak RSS {m["peak_rss"] / 2**20:.0f} MB')
+        line = ', '.join(parts)
+        if self.label:
+            line = f'{self.label}: {line}'
+        if self.tty:
+            print('\033[K\r' + line, file=self.out, end='\n' if done else '', flush=True)
+        else:
+            print(line, file=self.out, flush=True)
+
+    def write_log(self, done=False):
+        with open(self.log, 'a') as f:
+            f.write(json.dumps(self.metrics(done), ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.show(done=True)
+        if self.log:
+            self.write_log(done=True)
+
+
+def peak_rss():
+    """Peak resident memory in bytes of this process and the biggest of its finished children
+
+    Only children that were waited for are counted, so while pool workers
+    run this is a lower bound, which does not include them.
+    """
+    if resource is None:
+        return None
+    rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return rss if sys.platform == 'darwin' else rss * 1024  # kilobytes on Linux
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02}:{seconds:02}'
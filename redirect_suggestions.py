@@ -1,18 +1,13 @@
-from collections import Counter
-import json
 import sys
 
 import pywikibot
 
-with open('pages.lst') as f:
-    existing_pages = set(
-        p.strip() for p in f
-    )
+from pageindex import PageIndex
+from linkcount import Counts
 
-ci_existing = {p.lower(): p for p in existing_pages}
+existing_pages = PageIndex()
 
-with open('top_links.json') as f:
-    top_links = Counter(json.load(f))
+top_links = Counts()
 
 
 DRY_RUN = True
@@ -24,9 +19,7 @@ substitues = [
 enwiki = pywikibot.Site('en', "wikipedia")
 
 def iter_suggestions():
-    for link, frequency in top_links.most_common():
-        if frequency < 10:
-            break
+    for link, frequency in top_links.most_common(min_count=10):
         if link in existing_pages:
             continue
         # print(link, frequency, file=sys.stderr)
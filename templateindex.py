@@ -0,0 +1,242 @@
+"""
+Inverted index of templates used in page sources, and of comments left by bots.
+
+Built from the dump, and kept current from recent changes: pages edited,
+created, moved or deleted since the index was updated are reindexed from
+their current text. Answers which pages use any of given templates (or
+have problem comments of iw bot) in milliseconds, instead of slow and
+paginated insource: searches.
+
+Like insource: search, it sees templates written in the page source, not
+ones transcluded by other templates.
+
+    python3 templateindex.py ukwiki-pages-articles.xml.bz2 --workers 8
+    python3 templateindex.py --update
+
+    index = TemplateIndex()
+    index.pages_with(['Не перекладено', 'Нп'], namespaces=[0])
+    index.marked_pages(PROBLEM_MARKER)
+"""
+
+import os
+import re
+import sqlite3
+import argparse
+import threading
+from datetime import timedelta
+
+import pywikibot
+
+import dumpscan
+from templatenames import normalize
+
+INDEX_FILE = 'templates.sqlite'
+PROBLEM_MARKER = '<!-- Проблема вікіфікації'
+MARKERS = [PROBLEM_MARKER]
+RECENT_CHANGES_AGE = timedelta(days=30)  # how long wiki keeps recent changes
+UPDATE_BATCH_SIZE = 50  # pages preloaded with one request
+
+# {{name|...}} or {{name}}, but not {{{parameter}}}
+TEMPLATE_RE = re.compile(r'(?<!\{)\{\{(?!\{)\s*([^{}|<>\[\]\n#]+?)\s*(?:\||\}\})')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dump', nargs='?', help='build index from the dump')
+    parser.add_argument('--update', action='store_true', help='update index from recent changes')
+    parser.add_argument('--index', default=INDEX_FILE)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    if not args.dump and not args.update:
+        parser.error('give dump to build index from, or --update')
+
+    if args.dump:
+        index = build(args.dump, args.index, workers=args.workers)
+        print(f'Indexed templates of {len(index)} pages')
+    if args.update:
+        index = TemplateIndex(args.index)
+        update(index, pywikibot.Site('uk', 'wikipedia'))
+        print('Updated to', index.since())
+
+
+def template_names(text):
+    """Set of normalized names of templates used in text"""
+    names = set()
+    for m in TEMPLATE_RE.finditer(text):
+        name = normalize(m[1])
+        if name:
+            names.add(name)
+    return names
+
+
+def page_templates(page):
+    """Return (title, ns, template names, markers, timestamp) of dump page"""
+    text = page.text or ''
+    return (
+        page.title,
+        int(page.ns),
+        template_names(text),
+        [marker for marker in MARKERS if marker in text],
+        page.timestamp,
+    )
+
+
+def build(dump_filename, filename=INDEX_FILE, workers=1):
+    """Build index from the dump, replacing existing one"""
+    tmp_filename = filename + '.tmp'
+    if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+    index = TemplateIndex(tmp_filename)
+    since = None
+    rows = dumpscan.scan(dump_filename, page_templates, workers=workers)
+    for batch in dumpscan.batched(rows, 10000):
+        with index.db:
+            for title, ns, names, markers, timestamp in batch:
+                index._add(title, ns, names, markers)
+                since = max(since or timestamp, timestamp)
+    index.set_since(since)
+    index.db.close()
+    os.replace(tmp_filename, filename)
+    return TemplateIndex(filename)
+
+
+class TemplateIndex:
+    """Could be used from several threads"""
+
+    def __init__(self, filename=INDEX_FILE):
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS pages (
+                title TEXT PRIMARY KEY,
+                ns INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS templates (
+                name TEXT NOT NULL,
+                title TEXT NOT NULL,
+                PRIMARY KEY (name, title)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS templates_by_title ON templates (title);
+            CREATE TABLE IF NOT EXISTS markers (
+                marker TEXT NOT NULL,
+                title TEXT NOT NULL,
+                PRIMARY KEY (marker, title)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS markers_by_title ON markers (title);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            ) WITHOUT ROWID;
+        ''')
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT count(*) FROM pages').fetchone()[0]
+
+    def set_page(self, title, ns, text):
+        """Reindex page from its current text"""
+        with self.lock, self.db:
+            self._remove(title)
+            self._add(title, ns, template_names(text), [m for m in MARKERS if m in text])
+
+    def remove_page(self, title):
+        with self.lock, self.db:
+            self._remove(title)
+
+    def _add(self, title, ns, names, markers):
+        self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?)', (title, ns))
+        self.db.executemany('INSERT OR IGNORE INTO templates VALUES (?, ?)', ((n, title) for n in names))
+        self.db.executemany('INSERT OR IGNORE INTO markers VALUES (?, ?)', ((m, title) for m in markers))
+
+    def _remove(self, title):
+        for table in ('pages', 'templates', 'markers'):
+            self.db.execute(f'DELETE FROM {table} WHERE title = ?', (title, ))
+
+    def pages_with(self, names, namespaces=None):
+        """Sorted titles of pages that use any of templates"""
+        names = {n for n in map(normalize, names) if n}
+        return self._titles('templates', 'name', names, namespaces)
+
+    def marked_pages(self, marker=PROBLEM_MARKER, namespaces=None):
+        """Sorted titles of pages with marker (one of MARKERS) in text"""
+        return self._titles('markers', 'marker', [marker], namespaces)
+
+    def _titles(self, table, column, values, namespaces):
+        values = list(values)
+        query = f'''
+            SELECT DISTINCT t.title FROM {table} AS t JOIN pages USING (title)
+            WHERE t.{column} IN ({','.join('?' * len(values))})
+        '''
+        params = values
+        if namespaces is not None:
+            namespaces = [int(ns) for ns in namespaces]
+            query += f' AND pages.ns IN ({",".join("?" * len(namespaces))})'
+            params = values + namespaces
+        with self.lock:
+            return [title for title, in self.db.execute(query + ' ORDER BY t.title', params)]
+
+    def templates(self, title):
+        """Set of names of templates used on page"""
+        with self.lock:
+            return {name for name, in self.db.execute(
+                'SELECT name FROM templates WHERE title = ?', (title, )
+            )}
+
+    def since(self):
+        """Timestamp of the latest change in the index (ISO 8601, as in dumps and API)"""
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'since'").fetchone()
+        return row[0] if row else None
+
+    def set_since(self, timestamp):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('since', ?)", (timestamp, ))
+
+
+def changed_titles(changes):
+    """Return (titles to reindex, titles to remove, latest timestamp) from recent changes"""
+    changed = set()
+    removed = set()
+    latest = None
+    for rc in changes:
+        latest = max(latest or rc['timestamp'], rc['timestamp'])
+        if rc['type'] in ('edit', 'new'):
+            changed.add(rc['title'])
+        elif rc['type'] == 'log' and rc.get('logtype') == 'move':
+            removed.add(rc['title'])
+            changed.add(rc.get('logparams', {}).get('target_title'))
+        elif rc['type'] == 'log' and rc.get('logtype') == 'delete':
+            removed.add(rc['title'])
+            if rc.get('logaction') == 'restore':
+                changed.add(rc['title'])
+    changed.discard(None)
+    return changed, removed, latest
+
+
+def update(index, site):
+    """Reindex pages changed on site since the index was last updated"""
+    since = index.since()
+    if since is None:
+        raise ValueError('Index has no timestamp to update from, build it from a dump')
+    start = pywikibot.Timestamp.fromISOformat(since)
+    if pywikibot.Timestamp.utcnow() - start > RECENT_CHANGES_AGE:
+        print('Index is older than recent changes kept by wiki, some changes could be missed')
+
+    changed, removed, latest = changed_titles(
+        site.recentchanges(start=start, reverse=True, changetype='edit|new|log')
+    )
+    for title in removed:
+        index.remove_page(title)
+    pages = [pywikibot.Page(site, title) for title in sorted(changed)]
+    found = set()
+    for page in site.preloadpages(pages, groupsize=UPDATE_BATCH_SIZE):
+        index.set_page(page.title(), page.namespace().id, page.text)
+        found.add(page.title())
+    for title in changed - found:  # deleted after the change
+        index.remove_page(title)
+    if latest:
+        index.set_since(latest)
+
+
+if __name__ == '__main__':
+    main()
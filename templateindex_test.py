@@ -0,0 +1,55 @@
+import bz2
+
+from templateindex import TemplateIndex, build, normalize, template_names, changed_titles, PROBLEM_MARKER
+from dumpscan_test import HEADER, FOOTER
+
+PAGES = [
+    ('Київ', 0, '{{Не перекладено|Лавра||en|Lavra}} і {{нп|Дніпро}} {{{параметр}}} {{#if:1|так}}'),
+    ('Львів', 0, '{{Шаблон:Не_перекладено |Ратуша}}<!-- Проблема вікіфікації: щось -->'),
+    ('Обговорення:Київ', 1, '{{Стаття проєкту Фізика}} {{subst:Нп|x}}'),
+    ('Харків', 0, 'Текст без шаблонів'),
+]
+
+def write_dump(tmp_path):
+    filename = tmp_path / 'ukwiki-pages-articles.xml.bz2'
+    pages = ''.join(f'''  <page>
+    <title>{title}</title>
+    <ns>{ns}</ns>
+    <id>{i}</id>
+    <revision>
+      <id>{100 + i}</id>
+      <timestamp>2024-01-0{i}T00:00:00Z</timestamp>
+      <text xml:space="preserve">{text.replace('<', '&lt;').replace('>', '&gt;')}</text>
+    </revision>
+  </page>
+''' for i, (title, ns, text) in enumerate(PAGES, 1))
+    filename.write_bytes(bz2.compress((HEADER + pages + FOOTER).encode('utf-8')))
+    return str(filename)
+
+def test_template_names():
+    assert normalize(' шаблон:не_перекладено ') == 'Не перекладено'
+    assert normalize('#if:1') is None
+    assert template_names(PAGES[0][2]) == {'Не перекладено', 'Нп'}
+
+def test_template_index(tmp_path):
+    index = build(write_dump(tmp_path), str(tmp_path / 'templates.sqlite'), workers=2)
+    assert len(index) == 4
+    assert index.since() == '2024-01-04T00:00:00Z'
+    assert index.pages_with(['Не перекладено']) == ['Київ', 'Львів']
+    assert index.pages_with(['нп', 'Стаття проєкту Фізика'], namespaces=[0]) == ['Київ']
+    assert index.marked_pages(PROBLEM_MARKER) == ['Львів']
+
+    index.set_page('Львів', 0, '{{Нп|Ратуша}}')
+    assert index.pages_with(['Не перекладено']) == ['Київ']
+    assert index.marked_pages() == []
+    index.remove_page('Київ')
+    assert index.pages_with(['Нп']) == ['Львів']
+    assert TemplateIndex(str(tmp_path / 'templates.sqlite')).templates('Львів') == {'Нп'}
+
+def test_changed_titles():
+    changes = [
+        dict(type='edit', title='Київ', timestamp='2024-02-01T00:00:00Z'),
+        dict(type='log', logtype='move', title='Львів', logparams=dict(target_title='Львів (місто)'), timestamp='2024-02-03T00:00:00Z'),
+        dict(type='log', logtype='delete', logaction='delete', title='Харків', timestamp='2024-02-02T00:00:00Z'),
+    ]
+    assert changed_titles(changes) == ({'Київ', 'Львів (місто)'}, {'Львів', 'Харків'}, '2024-02-03T00:00:00Z')
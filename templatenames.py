@@ -0,0 +1,168 @@
+"""
+Resolver of template names: any spelling or redirect of template to its canonical title.
+
+Names are normalized like MediaWiki does with titles (namespace prefix,
+underscores, repeated spaces, case of the first letter), then redirects
+between templates are followed. Redirects of template namespace are
+fetched from wiki with a few requests, and cached on disk for MAX_AGE
+when the cache file is given, so lookups are dictionary lookups.
+Without site, only names are normalized.
+
+    python3 templatenames.py  # refresh the cache
+
+    names = TemplateNames(pywikibot.Site('uk', 'wikipedia'), CACHE_FILE)
+    names.resolve('нп')  # 'Не перекладено'
+    names.in_group('Нп', ['Не перекладено', 'Iw'])
+    names.spellings(['Не перекладено'])  # all redirects to it, and itself
+"""
+
+import re
+import json
+import time
+import threading
+from datetime import timedelta
+
+import pywikibot
+
+CACHE_FILE = 'templatenames.json'
+MAX_AGE = timedelta(days=7)
+TEMPLATE_NAMESPACE = 10
+MAX_RESOLVED = 100000  # names as written in pages, kept with their canonical names
+
+TEMPLATE_PREFIX_RE = re.compile(r'^(?:шаблон|template)\s*:\s*', re.I)
+
+
+def main():
+    names = TemplateNames(pywikibot.Site('uk', 'wikipedia'), CACHE_FILE, max_age=timedelta(0))
+    names.load()
+    print(f'Cached {len(names.aliases)} template redirects')
+
+
+def normalize(name):
+    """Title of template as MediaWiki sees it, without namespace, or None for parser functions"""
+    name = TEMPLATE_PREFIX_RE.sub('', name.replace('_', ' ').strip())
+    name = ' '.join(name.split())
+    if not name or ':' in name:  # subst:, parser functions, pages of other namespaces
+        return None
+    return name[0].upper() + name[1:]
+
+
+def fetch_redirects(site):
+    """Return {redirect: target} of all redirects in template namespace of site"""
+    redirects = {}
+    params = dict(
+        action='query',
+        generator='allpages',
+        gapnamespace=TEMPLATE_NAMESPACE,
+        gapfilterredir='redirects',
+        gaplimit='max',
+        redirects=True,
+    )
+    while True:
+        data = site.simple_request(**params).submit()
+        for r in data.get('query', {}).get('redirects', []):
+            redirects[r['from']] = r['to']
+        if 'continue' not in data:
+            return redirects
+        params.update(data['continue'])
+
+
+def resolve_redirects(redirects):
+    """Return {normalized name: canonical name} with chains of redirects followed"""
+    targets = {}
+    for source, target in redirects.items():
+        source, target = normalize(source), normalize(target)
+        if source and target:
+            targets[source] = target
+    aliases = {}
+    for source in targets:
+        seen = {source}
+        target = targets[source]
+        while target in targets and target not in seen:  # double redirect
+            seen.add(target)
+            target = targets[target]
+        aliases[source] = target
+    return aliases
+
+
+class TemplateNames:
+    """Could be used from several threads"""
+
+    def __init__(self, site=None, filename=None, max_age=MAX_AGE):
+        self.site = site  # to refresh the cache from, when it is stale
+        self.filename = filename  # of the cache, or None to fetch redirects on every start
+        self.max_age = max_age.total_seconds()
+        self.aliases = None  # normalized name: canonical name, loaded on first use
+        self.groups = {}  # frozenset of names: frozenset of their canonical names
+        self.resolved = {}  # name as written: canonical name
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Load redirects from cache, refreshing it from site if it is stale"""
+        cached = {}
+        if self.filename is not None:
+            try:
+                with open(self.filename) as f:
+                    cached = json.load(f)
+            except FileNotFoundError:
+                pass
+        redirects = cached.get('redirects', {})
+        if self.site is not None and time.time() - cached.get('fetched', 0) > self.max_age:
+            try:
+                redirects = fetch_redirects(self.site)
+                if self.filename is not None:
+                    with open(self.filename, 'w') as f:
+                        json.dump(dict(fetched=time.time(), redirects=redirects), f, ensure_ascii=False)
+            except pywikibot.exceptions.Error as e:
+                print('Could not fetch template redirects, using cached ones:', e)
+        aliases = resolve_redirects(redirects)
+        self.groups = {}
+        self.resolved = {}
+        self.aliases = aliases
+
+    def _ensure_loaded(self):
+        if self.aliases is None:
+            with self.lock:
+                if self.aliases is None:
+                    self.load()
+
+    def resolve(self, name):
+        """Canonical title of template (without namespace), or None if it is not a template"""
+        self._ensure_loaded()
+        name = str(name)
+        try:
+            return self.resolved[name]
+        except KeyError:
+            pass
+        canonical = normalize(name)
+        canonical = self.aliases.get(canonical, canonical)
+        if len(self.resolved) >= MAX_RESOLVED:
+            self.resolved = {}
+        self.resolved[name] = canonical
+        return canonical
+
+    def group(self, names):
+        """Frozenset of canonical titles of templates, computed once for every set of names
+
+        Pass names as frozenset made once, so it is not built for every call.
+        """
+        key = names if isinstance(names, frozenset) else frozenset(names)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = frozenset(filter(None, map(self.resolve, key)))
+        return group
+
+    def in_group(self, name, names):
+        """Whether name is a spelling or redirect of one of templates in names"""
+        return self.resolve(name) in self.group(names)
+
+    def spellings(self, names):
+        """Set of normalized names of templates and all redirects to them"""
+        group = self.group(names)
+        return set(group) | {n for n in map(normalize, names) if n} | {
+            alias for alias, target in self.aliases.items() if target in group
+        }
+
+
+if __name__ == '__main__':
+    main()
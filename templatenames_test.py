@@ -0,0 +1,39 @@
+import fakewiki
+from templatenames import TemplateNames, normalize, resolve_redirects
+
+def test_normalize():
+    assert normalize(' шаблон:не_перекладено ') == 'Не перекладено'
+    assert normalize('Template:iw') == 'Iw'
+    assert normalize('subst:нп') is None
+
+def test_resolve_redirects():
+    assert resolve_redirects({
+        'Шаблон:Нп': 'Шаблон:Не перекладено',
+        'Шаблон:Iw': 'Шаблон:Нп',  # double redirect
+        'Шаблон:А': 'Шаблон:Б',
+        'Шаблон:Б': 'Шаблон:А',  # loop
+    }) == {'Нп': 'Не перекладено', 'Iw': 'Не перекладено', 'А': 'А', 'Б': 'Б'}
+
+def test_template_names(tmp_path):
+    world = fakewiki.FakeWorld(dict(sites=dict(uk=dict(
+        pages={'Шаблон:Не перекладено': '', 'Шаблон:Нп': '#REDIRECT [[Шаблон:Не перекладено]]'},
+        redirects={'Шаблон:Нп': 'Шаблон:Не перекладено', 'Київ': 'Місто Київ'},
+    ))))
+    filename = str(tmp_path / 'templatenames.json')
+    names = TemplateNames(world.site('uk'), filename)
+    assert names.resolve('нп') == 'Не перекладено'
+    assert names.resolve('Шаблон:Не_перекладено') == 'Не перекладено'
+    assert names.in_group('Нп', ['Не перекладено'])
+    assert not names.in_group('Київ', ['Не перекладено'])
+    assert names.spellings(['Не перекладено']) == {'Не перекладено', 'Нп'}
+    assert world.calls['query'] == 1
+
+    # fresh cache is used without requests
+    assert TemplateNames(world.site('uk'), filename).resolve('Нп') == 'Не перекладено'
+    assert world.calls['query'] == 1
+
+def test_groups_of_temporary_lists():
+    names = TemplateNames()
+    for _ in range(3):
+        assert names.in_group('нп', ['Не перекладено', 'Нп'])
+    assert len(names.groups) == 1
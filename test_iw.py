@@ -1,6 +1,15 @@
+import pytest
 import mwparserfromhell
 
+import iw
 from iw import get_params, iw_templates
+from templatenames import TemplateNames
+
+
+@pytest.fixture(autouse=True)
+def template_names(monkeypatch):
+    """Names of templates without redirects, which are not fetched from wiki"""
+    monkeypatch.setattr(iw, 'TEMPLATE_NAMES', TemplateNames())
 
 def tmpl(text):
     code = mwparserfromhell.parse(text)
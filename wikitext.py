@@ -0,0 +1,156 @@
+"""
+Fast extraction of wikilinks and headings from wikitext.
+
+Gives the same titles as filter_wikilinks() and filter_headings() of
+mwparserfromhell, without building the node tree. Handles comments,
+nowiki-like tags, templates, nested links and file captions; on anything
+unusual (broken markup, links inside attributes, templates spanning link
+ends, template parameters, ...) falls back to mwparserfromhell for the whole page.
+
+    links, headings = links_and_headings(page.text)
+"""
+
+import re
+
+import mwparserfromhell
+from mwparserfromhell.definitions import PARSER_BLACKLIST, URI_SCHEMES
+
+FILLER = '\x01'  # takes place of comments and contents of nowiki-like tags
+
+MASKED_RE = re.compile(
+    r'<!--.*?-->|<(%s)(?:\s[^<>]*?)?(?:/>|>.*?</\1\s*>)' % '|'.join(PARSER_BLACKLIST),
+    re.S | re.I,
+)
+UNMASKED_RE = re.compile(r'<!--|<(?:%s)[\s/>]' % '|'.join(PARSER_BLACKLIST), re.I)
+ATTRIBUTE_MARKUP_RE = re.compile(r'<[a-zA-Z][^<>]*?(?:\[\[|\{\{)')
+TOKEN_RE = re.compile(r'\[\[|\]\]|\{\{|\}\}|\||\n|\[')
+BAD_TITLE_RE = re.compile(r'[\[\]{}<>\n%s]|\'\'|://' % FILLER)
+URI_RE = re.compile(  # schemes that need no slashes, like mailto:
+    r'\s*(?://|(%s):)' % '|'.join(s for s, slashes in URI_SCHEMES.items() if not slashes),
+    re.I,
+)
+QUOTES_RE = re.compile(r"''+")
+TAG_RE = re.compile(r'<(?!br\s*/?>)', re.I)
+CLOSING_RE = re.compile(r'(=+)[^=]*$')
+BAD_HEADING_RE = re.compile(r"[\[{<%s]|''" % FILLER)
+
+
+class Unsupported(Exception):
+    """Markup that should be parsed by mwparserfromhell"""
+
+
+def links_and_headings(text):
+    """Return (titles of wikilinks, titles of headings) of wikitext"""
+    try:
+        return scan(text)
+    except Unsupported:
+        code = mwparserfromhell.parse(text)
+        return (
+            [str(l.title) for l in code.filter_wikilinks()],
+            [str(h.title) for h in code.filter_headings()],
+        )
+
+
+def wikilinks(text):
+    return links_and_headings(text)[0]
+
+
+def headings(text):
+    return links_and_headings(text)[1]
+
+
+def scan(text):
+    """Fast path of links_and_headings, raises Unsupported"""
+    text = MASKED_RE.sub(FILLER, text)
+    if UNMASKED_RE.search(text) or ATTRIBUTE_MARKUP_RE.search(text) or '{{{' in text:
+        raise Unsupported  # template parameters and braces are parsed differently
+
+    links = []  # (start, title)
+    headings = []
+    stack = []  # [start, title, templates depth, start of text] of open links
+    depth = 0  # templates depth outside of links
+    resume = 0  # tokens before this position are inside of link titles
+
+    if text.startswith('='):
+        add_heading(headings, text, 0, depth)
+
+    for token in TOKEN_RE.finditer(text):
+        kind = token.group()
+        pos = token.start()
+        if pos < resume:
+            continue
+        if kind == '[[':
+            if text.startswith('[', pos + 2):
+                raise Unsupported
+            end = find_title_end(text, pos + 2)
+            title = text[pos + 2:end]
+            if BAD_TITLE_RE.search(title) or URI_RE.match(title):
+                raise Unsupported
+            if text.startswith(']]', end):
+                links.append((pos, title))
+                resume = end + 2
+            else:
+                stack.append([pos, title, 0, end + 1])
+                resume = end + 1
+        elif not stack:
+            if kind == '{{':
+                depth += 1
+            elif kind == '}}':
+                depth = max(depth - 1, 0)
+            elif kind == '\n' and text.startswith('=', pos + 1):
+                add_heading(headings, text, pos + 1, depth)
+        elif kind == ']]':
+            start, title, link_depth, text_start = stack.pop()
+            if link_depth:
+                raise Unsupported
+            check_link_text(text[text_start:pos])
+            links.append((start, title))
+        elif kind == '{{':
+            stack[-1][2] += 1
+        elif kind == '}}':
+            stack[-1][2] = max(stack[-1][2] - 1, 0)
+        elif kind in ('[', '\n'):
+            raise Unsupported
+
+    if stack:
+        raise Unsupported  # unclosed links are reparsed as text
+
+    links.sort()
+    return [title for _, title in links], headings
+
+
+def find_title_end(text, start):
+    pipe = text.find('|', start)
+    close = text.find(']]', start)
+    if close < 0:
+        raise Unsupported
+    if 0 <= pipe < close:
+        return pipe
+    return close
+
+
+def check_link_text(link_text):
+    """Bold, italic and tags should be closed in link text"""
+    if TAG_RE.search(link_text):
+        raise Unsupported
+    runs = [len(q) for q in QUOTES_RE.findall(link_text)]
+    if len(runs) % 2 or runs != runs[::-1] or any(r == 4 or r > 5 for r in runs):
+        raise Unsupported
+
+
+def add_heading(headings, text, start, depth):
+    """Add title of heading on the line that starts at start, if it is one"""
+    end = text.find('\n', start)
+    if end < 0:
+        end = len(text)
+    line = text[start:end]
+    if depth or BAD_HEADING_RE.search(line):
+        raise Unsupported
+    opening = len(line) - len(line.lstrip('='))
+    closing = CLOSING_RE.search(line, opening)
+    if not closing:
+        return
+    level = min(opening, len(closing[1]), 6)
+    headings.append(
+        '=' * (opening - level) + line[opening:closing.start()] + '=' * (len(closing[1]) - level)
+    )
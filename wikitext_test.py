@@ -0,0 +1,91 @@
+import os
+import random
+from itertools import islice
+
+import pytest
+import mwparserfromhell
+
+from wikitext import links_and_headings, scan, Unsupported
+
+def expected(text):
+    code = mwparserfromhell.parse(text)
+    return (
+        [str(l.title) for l in code.filter_wikilinks()],
+        [str(h.title) for h in code.filter_headings()],
+    )
+
+ARTICLE = '''{{Infobox person
+| name = Тарас Шевченко
+| birth_place = [[Моринці]], [[Київська губернія]]
+}}
+\'\'\'Тарас Григорович Шевченко\'\'\' ({{н}} [[9 березня]] [[1814]]) — український [[поет]].<ref name="esu">{{cite web|url=http://esu.com.ua/|title=ЕСУ|publisher=[[НАН України]]}}</ref>
+
+== Біографія ==
+Народився в [[Моринці|Моринцях]] у родині [[кріпацтво|кріпака]]. <!-- коментар [[не посилання]] -->
+[[Файл:Shevchenko.jpg|thumb|left|Портрет, {{lang-en|portrait}} роботи [[Іван Крамськой|\'\'Крамського\'\']]]]
+
+=== Дитинство ===
+* [[Кирило Шевченко#Життя|батько]]<br/>
+* [[:Категорія:Поети]], [[en:Taras Shevchenko]]
+<gallery>
+Файл:A.jpg|[[Київ]]
+</gallery>
+<nowiki>[[Не посилання]]</nowiki>
+{| class="wikitable"
+|-
+| [[Київ]] || 1843
+|}
+==== Рівень 4 ===
+== Примітки ==
+{{reflist}}
+* [http://litopys.org.ua Літопис] — [[Ізборник]] [[A&amp;B]]
+[[Категорія:Українські поети]]'''
+
+CASES = [
+    ARTICLE,
+    '[[]]', '[[|x]]', '[[ A ]]', '[[A|]]', "[[A''b'']]", "[[A|'''b]]'''",
+    '[[A|b [[C]] d', '[[A|[[B]]]]', '[[A|x\n== H ==\n]]', '[[A]B]]', '[[A|b]]]', '[[[A]]]',
+    '[[http://example.com]]', '[[mailto:a@b.c]]', '[[A|[http://x y]]]',
+    '[[A|<div>]]</div>', '<div title="[[X]]">[[Y]]</div>', '{{A|[[B]]=c}}',
+    '<!-- a\n== H ==', '<nowiki>[[A]]', '<pre>\n== H ==\n</pre>',
+    '== A ==', '=== A ==\n', '= A = b\n', '== A = B ==', '====', "== ''A'' ==",
+    '{{A|\n== H ==\n}}', '{{A|b=\n== H ==\n}}', '}} {{A|\n== H ==\n}}', '<ref>\n== H ==\n</ref>',
+    '{{{{[[B|c]]<ref name=a>}}}', '{{{1|[[A]]}}}',
+]
+
+def test_cases():
+    for text in CASES:
+        assert links_and_headings(text) == expected(text), text
+
+def test_fast_path_for_usual_article():
+    assert scan(ARTICLE) == expected(ARTICLE)
+
+def test_template_parameters_are_unsupported():
+    with pytest.raises(Unsupported):
+        scan('{{{{[[B|c]]<ref name=a>}}}')
+
+FRAGMENTS = [
+    '[[', ']]', '[[A', '[[Київ]]', '[[B|c]]', '|', '{{', '}}', '{{cite|a=', '\n',
+    '\n== H ==\n', '\n=== Розділ ==\n', '=', "''", "'''", '<!--', '-->', '<!-- c -->',
+    '<nowiki>', '</nowiki>', '<ref>', '</ref>', '<ref name="x"/>', '[http://x.org y]',
+    '[', ']', ' текст ', '[[File:a.jpg|thumb|', '#', ':', '*', '{|', '|}', '&amp;',
+    '<gallery>\nF.jpg|[[G]]\n</gallery>', '<div>', '</div>', '{{{1|', '}}}', '<br/>',
+]
+
+def test_random_markup():
+    rnd = random.Random(1814)
+    for _ in range(3000):
+        text = ''.join(rnd.choice(FRAGMENTS) for _ in range(rnd.randint(1, 25)))
+        try:
+            assert scan(text) == expected(text), text
+        except Unsupported:
+            pass
+
+def test_dump_sample():
+    """Set WIKITEXT_DUMP to a dump file to compare on its first pages"""
+    filename = os.environ.get('WIKITEXT_DUMP')
+    if not filename:
+        pytest.skip('WIKITEXT_DUMP is not set')
+    from dumpscan import scan as scan_dump
+    for page in islice(scan_dump(filename), int(os.environ.get('WIKITEXT_PAGES', 2000))):
+        assert links_and_headings(page.text) == expected(page.text), page.title